@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+栅格重建共享工具：从(行,列,值)散射重建2D网格
+
+入参:
+- rows/cols (numpy.ndarray): 每个数据点的网格行列索引
+- values (numpy.ndarray): 每个数据点的像素值
+- out (numpy.ndarray): 预分配的2D输出网格
+
+方法:
+- step3（热力图）与step4（GeoTIFF/PNG）从CSV重建栅格时是同一种散射模式，
+  统一收敛到本模块的单一热点路径
+- Numba可用时用prange并行散射核（JIT编译一次后缓存复用），
+  否则回退到NumPy花式索引赋值
+
+出参:
+- regular_grid_indices 返回: tuple或None - 规则网格的算术索引与规模
+- scatter_to_grid 返回: numpy.ndarray - 写入完成的out网格（原地修改）
+- scatter_pixels_to_image 返回: numpy.ndarray - 写入完成的out图像（原地修改）
+- scatter_bands_to_grid 返回: numpy.ndarray - 写入完成的out立方体（原地修改）
+"""
+
+import numpy as np
+
+# Numba为可选依赖：存在时使用并行散射核，否则回退到NumPy花式索引
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 规则网格算术定位配置
+GRID_SPACING_SAMPLE = 4096             # 估计网格步长时采样的坐标数
+GRID_INDEX_TOL = 0.25                  # 网格规则性容差（相对步长的偏差上限）
+
+
+def regular_grid_indices(values):
+    """
+    假设坐标位于等间距规则网格上，用算术直接计算网格索引
+
+    入参:
+    - values (numpy.ndarray): 一维坐标数组（经度或纬度）
+
+    方法:
+    ① 取前GRID_SPACING_SAMPLE个坐标的unique最小间隔作为网格步长估计
+    ② 索引 = round((值 - 最小值) / 步长)，单次向量化算术完成全部定位
+    ③ 校验规则性：任一坐标与最近格点的偏差超过GRID_INDEX_TOL倍步长，
+       或索引越界，则判定网格不规则并返回None（调用方回退到searchsorted）
+
+    出参:
+    - tuple (indices, size) 或 None: 索引数组与网格点数；不规则时为None
+    """
+    vmin = values.min()
+    sample = np.unique(values[:min(values.size, GRID_SPACING_SAMPLE)])
+    if sample.size < 2:
+        return None
+    step = np.min(np.diff(sample))
+    if step <= 0:
+        return None
+
+    size = int(round((values.max() - vmin) / step)) + 1
+    scaled = (values - vmin) / step
+    indices = np.rint(scaled)
+    if np.max(np.abs(scaled - indices)) > GRID_INDEX_TOL:
+        return None
+    indices = indices.astype(np.int64)
+    if indices.max() >= size:
+        return None
+    return indices, size
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _scatter_kernel(rows, cols, values, out):
+        """
+        并行散射核：out[rows[i], cols[i]] = values[i]（Numba prange）
+
+        入参:
+        - rows/cols (np.ndarray): 一维行列索引数组
+        - values (np.ndarray): 一维像素值数组（dtype与out一致）
+        - out (np.ndarray): 预分配的2D输出网格
+
+        方法:
+        - prange按数据点并行写入；索引互不重复时无写冲突
+
+        出参:
+        - 无（结果写入out）
+        """
+        for i in prange(rows.size):
+            out[rows[i], cols[i]] = values[i]
+
+    @njit(parallel=True, cache=True)
+    def _scatter_pixels_kernel(rows, cols, values, out):
+        """
+        通道在后并行散射核：out[rows[i], cols[i], b] = values[i, b]（Numba prange）
+
+        入参:
+        - rows/cols (np.ndarray): 一维行列索引数组
+        - values (np.ndarray): (N, 通道数)像素值数组（dtype与out一致）
+        - out (np.ndarray): 预分配的(高, 宽, 通道数)输出图像
+
+        方法:
+        - prange按数据点并行，内层循环写完该像素全部通道：
+          通道在后布局下同一像素的通道连续存放，写入即顺序访存
+
+        出参:
+        - 无（结果写入out）
+        """
+        for i in prange(rows.size):
+            r = rows[i]
+            c = cols[i]
+            for b in range(values.shape[1]):
+                out[r, c, b] = values[i, b]
+
+    @njit(parallel=True, cache=True)
+    def _scatter_bands_kernel(rows, cols, values, out):
+        """
+        多波段并行散射核：out[b, rows[i], cols[i]] = values[i, b]（Numba prange）
+
+        入参:
+        - rows/cols (np.ndarray): 一维行列索引数组
+        - values (np.ndarray): (N, 波段数)像素值数组（dtype与out一致）
+        - out (np.ndarray): 预分配的(波段数, 高, 宽)输出立方体
+
+        方法:
+        - prange按数据点并行，内层循环展开全部波段：
+          一遍内存访问写完所有波段，免去逐波段多次散射
+
+        出参:
+        - 无（结果写入out）
+        """
+        for i in prange(rows.size):
+            r = rows[i]
+            c = cols[i]
+            for b in range(values.shape[1]):
+                out[b, r, c] = values[i, b]
+
+
+def _raster_order(rows, cols, width):
+    """
+    计算使散射写入变为行主序顺序访存的重排序索引
+
+    入参:
+    - rows/cols (numpy.ndarray): 一维行列索引数组
+    - width (int): 输出网格宽度（列数）
+
+    方法:
+    - 以行主序线性地址 rows*width+cols 为键做稳定argsort：
+      重排后散射按输出内存顺序写入，每条缓存行只碰一次
+    - 栅格导出的CSV通常本就按行主序排列，线性地址严格递增时
+      直接跳过排序（一次np.diff扫描即可判定）
+    - 稳定排序保证重复坐标的"后写覆盖"语义与原顺序一致
+
+    出参:
+    - numpy.ndarray或None: 重排序索引；已有序时返回None
+    """
+    flat = rows.astype(np.int64) * width + cols
+    if flat.size < 2 or np.all(np.diff(flat) > 0):
+        return None
+    return np.argsort(flat, kind='stable')
+
+
+def scatter_to_grid(rows, cols, values, out):
+    """
+    将一维数据点散射到2D网格：out[rows, cols] = values
+
+    入参:
+    - rows (numpy.ndarray): 一维行索引数组
+    - cols (numpy.ndarray): 一维列索引数组
+    - values (numpy.ndarray): 一维像素值数组
+    - out (numpy.ndarray): 预分配的2D输出网格（原地写入）
+
+    方法:
+    ① 将values统一转为out的dtype（截断语义与NumPy花式赋值一致，
+       同时避免Numba按dtype组合重复特化）
+    ② Numba可用时调用并行散射核，否则用花式索引单次赋值
+
+    出参:
+    - numpy.ndarray: 写入完成的out网格
+    """
+    values = np.ascontiguousarray(values).astype(out.dtype, copy=False)
+
+    order = _raster_order(rows, cols, out.shape[1])
+    if order is not None:
+        rows, cols, values = rows[order], cols[order], values[order]
+
+    if NUMBA_AVAILABLE:
+        _scatter_kernel(np.ascontiguousarray(rows), np.ascontiguousarray(cols),
+                        values, out)
+    else:
+        out[rows, cols] = values
+
+    return out
+
+
+def scatter_pixels_to_image(rows, cols, values, out):
+    """
+    将(N, 通道数)数据点一次散射到(高, 宽, 通道数)图像（通道在后布局）
+
+    入参:
+    - rows (numpy.ndarray): 一维行索引数组
+    - cols (numpy.ndarray): 一维列索引数组
+    - values (numpy.ndarray): (N, 通道数)像素值数组
+    - out (numpy.ndarray): 预分配的(高, 宽, 通道数)输出图像（原地写入）
+
+    方法:
+    ① 将values统一转为out的dtype（截断语义与NumPy花式赋值一致）
+    ② Numba可用时调用通道在后散射核，否则用花式索引 out[rows, cols] = values
+    通道在后布局与PIL的原生缓冲一致，出图时无需转置拷贝
+
+    出参:
+    - numpy.ndarray: 写入完成的out图像
+    """
+    values = np.ascontiguousarray(values).astype(out.dtype, copy=False)
+
+    order = _raster_order(rows, cols, out.shape[1])
+    if order is not None:
+        rows, cols, values = rows[order], cols[order], values[order]
+
+    if NUMBA_AVAILABLE:
+        _scatter_pixels_kernel(np.ascontiguousarray(rows),
+                               np.ascontiguousarray(cols), values, out)
+    else:
+        out[rows, cols] = values
+
+    return out
+
+
+def scatter_bands_to_grid(rows, cols, values, out):
+    """
+    将(N, 波段数)数据点一次散射到(波段数, 高, 宽)立方体
+
+    入参:
+    - rows (numpy.ndarray): 一维行索引数组
+    - cols (numpy.ndarray): 一维列索引数组
+    - values (numpy.ndarray): (N, 波段数)像素值数组
+    - out (numpy.ndarray): 预分配的(波段数, 高, 宽)输出立方体（原地写入）
+
+    方法:
+    ① 将values统一转为out的dtype（截断语义与NumPy花式赋值一致）
+    ② Numba可用时调用多波段并行散射核：每个数据点一遍写完全部波段，
+       替代逐波段的多次gather-store
+    ③ 否则用花式索引转置赋值 out[:, rows, cols] = values.T
+
+    出参:
+    - numpy.ndarray: 写入完成的out立方体
+    """
+    values = np.ascontiguousarray(values).astype(out.dtype, copy=False)
+
+    order = _raster_order(rows, cols, out.shape[2])
+    if order is not None:
+        rows, cols, values = rows[order], cols[order], values[order]
+
+    if NUMBA_AVAILABLE:
+        _scatter_bands_kernel(np.ascontiguousarray(rows),
+                              np.ascontiguousarray(cols), values, out)
+    else:
+        out[:, rows, cols] = values.T
+
+    return out
@@ -21,13 +21,24 @@
 - step4_BOA.tif（BOA反射率）
 """
 
+import argparse
+import hashlib
+import multiprocessing
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 预加载重量级依赖（matplotlib冷导入约0.5秒；在启动器加载时一次付清，
+# 步骤函数与并行worker随后都直接命中已导入的模块）
+import matplotlib
+matplotlib.use('Agg')  # 纯文件输出，在导入pyplot前锁定无GUI后端
+import matplotlib.pyplot  # noqa: F401
+import rasterio  # noqa: F401
 
 # 导入各步骤的核心处理函数
 from step1_tiff_to_csv_extractor import extract_bands_to_csv_with_mask
-from step2_ndwi_ndvi_calculator import compute_indices
+from step2_ndwi_ndvi_calculator import compute_indices, load_table
 from step3_visualize_mask_gray import csv_to_heatmap
 from step4_csv_to_tiff_converter import csv_to_geotiff, csv_to_png
 
@@ -74,6 +85,15 @@ TIFF_CRS = 'EPSG:4326'                                 # 坐标系
 RESTORE_REFLECTANCE_RGB = False                        # RGB文件不恢复反射率
 RESTORE_REFLECTANCE_BOA = True                         # BOA文件恢复反射率
 
+# 步骤缓存配置
+ENABLE_CACHE = True                                    # 输入和参数未变时跳过已完成的步骤
+HASH_SUFFIX = '.hash'                                  # 缓存指纹侧文件后缀
+
+# 并行输出配置（Step3热力图与Step4的3个写出任务互不冲突，可多进程并行）
+# 设置环境变量 GEE_SEQUENTIAL=1 可回退为串行执行，便于调试
+PARALLEL_OUTPUTS = os.environ.get('GEE_SEQUENTIAL', '0') != '1'
+PARALLEL_MAX_WORKERS = 4                               # 并行进程数
+
 # ====================================================
 
 
@@ -125,6 +145,91 @@ def print_error(message):
     print(f"❌ {message}")
 
 
+def config_hash(paths, params):
+    """
+    计算一组输入文件和配置参数的指纹
+
+    入参:
+    - paths (list): 输入文件路径列表
+    - params (tuple): 影响该步骤结果的配置参数
+
+    方法:
+    - 对每个输入文件取大小和mtime（无需读取内容）
+    - 连同参数的repr一起送入blake2b哈希
+
+    出参:
+    - digest (str): 十六进制指纹字符串
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        stat = os.stat(path)
+        h.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    h.update(repr(params).encode())
+    return h.hexdigest()
+
+
+def cache_valid(outputs, expected_hash):
+    """
+    检查步骤缓存是否命中
+
+    入参:
+    - outputs (list): 该步骤的输出文件路径列表
+    - expected_hash (str): 当前输入+参数的指纹
+
+    方法:
+    - 所有输出文件都存在，且第一个输出旁的.hash侧文件内容与指纹一致时命中
+
+    出参:
+    - bool: 缓存是否有效
+    """
+    if not ENABLE_CACHE:
+        return False
+    if not all(os.path.exists(p) for p in outputs):
+        return False
+    hash_path = outputs[0] + HASH_SUFFIX
+    if not os.path.exists(hash_path):
+        return False
+    with open(hash_path, 'r', encoding='utf-8') as f:
+        return f.read().strip() == expected_hash
+
+
+def write_cache_hash(outputs, expected_hash):
+    """
+    写入步骤缓存指纹
+
+    入参:
+    - outputs (list): 该步骤的输出文件路径列表
+    - expected_hash (str): 当前输入+参数的指纹
+
+    方法:
+    - 在第一个输出文件旁写入.hash侧文件
+
+    出参: 无
+    """
+    if not ENABLE_CACHE:
+        return
+    with open(outputs[0] + HASH_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write(expected_hash)
+
+
+def init_parallel_worker():
+    """
+    进程池worker初始化：预加载重量级依赖
+
+    入参: 无
+
+    方法:
+    - 在worker启动时导入matplotlib（Agg后端）和rasterio
+    - 导入成本在进程池建立时一次付清，而不是首个任务执行时
+
+    出参: 无
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401
+    import rasterio  # noqa: F401
+
+
 def get_full_path(relative_path):
     """
     获取完整路径
@@ -159,34 +264,44 @@ def step1_tiff_to_csv():
     - 应用裁剪、Gamma校正等预处理
     - 保存为CSV格式
     
-    出参: 
+    出参:
+    - pd.DataFrame: step1提取结果（失败时返回None）
     - step1_output.csv: 包含经纬度、RGBN波段值的CSV文件
     - step1_output_clipped.tif: 裁剪后的原始影像
     - step1_output_rgb_converted.tif: RGB转换后的影像
     """
     print_header(1, "TIFF影像 → CSV表格")
-    
+
     # 构建文件路径
     input_image = get_full_path(f"{INPUT_OUTPUT_DIR}/{INPUT_IMAGE_FILE}")
     input_mask = get_full_path(f"{INPUT_OUTPUT_DIR}/{INPUT_MASK_FILE}")
     output_csv = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP1_OUTPUT_CSV}")
-    
+
     # 检查输入文件
     if not os.path.exists(input_image):
         print_error(f"输入影像文件不存在: {input_image}")
-        return False
+        return None
     if not os.path.exists(input_mask):
         print_error(f"输入掩膜文件不存在: {input_mask}")
-        return False
-    
+        return None
+
     print(f"输入影像: {INPUT_IMAGE_FILE}")
     print(f"输入掩膜: {INPUT_MASK_FILE}")
     print(f"输出CSV: {STEP1_OUTPUT_CSV}")
     print(f"波段顺序: {', '.join(BAND_ORDER)}")
-    
+
+    # 检查缓存（输入文件和参数未变时直接加载已有结果）
+    expected_hash = config_hash(
+        [input_image, input_mask],
+        (BAND_ORDER, CLIP_MIN, CLIP_MAX, GAMMA, CONVERT_RGB, SAVE_CLIPPED_TIFF, STRETCH_255)
+    )
+    if cache_valid([output_csv], expected_hash):
+        print_success(f"Step1命中缓存，直接加载已有结果: {STEP1_OUTPUT_CSV}")
+        return load_table(output_csv)
+
     # 执行转换
     start_time = time.time()
-    extract_bands_to_csv_with_mask(
+    df = extract_bands_to_csv_with_mask(
         input_path=input_image,
         mask_path=input_mask,
         output_path=output_csv,
@@ -199,194 +314,305 @@ def step1_tiff_to_csv():
         stretch_255=STRETCH_255
     )
     elapsed_time = time.time() - start_time
-    
+    write_cache_hash([output_csv], expected_hash)
+
     print_success(f"Step1完成！耗时: {elapsed_time:.2f}秒")
-    return True
+    return df
 
 
-def step2_compute_indices():
+def step2_compute_indices(input_df=None):
     """
     Step2: 计算NDWI和NDVI指数
-    
-    入参: 无（使用全局配置）
-    
+
+    入参:
+    - input_df (pd.DataFrame): Step1的内存结果，None时回退到读取CSV文件
+
     方法:
-    - 读取Step1输出的CSV文件
+    - 使用Step1传入的DataFrame（或读取Step1输出的CSV文件）
     - 基于Green和NIR波段计算NDWI（水体指数）
     - 基于Red和NIR波段计算NDVI（植被指数）
     - 保存增强后的CSV文件
-    
+
     出参:
+    - pd.DataFrame: 含指数的结果数据（失败时返回None）
     - step2_output_with_indices.csv: 包含原始数据+NDWI+NDVI的CSV文件
     """
     print_header(2, "计算NDWI和NDVI指数")
-    
+
     # 构建文件路径
     input_csv = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP1_OUTPUT_CSV}")
     output_csv = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP2_OUTPUT_CSV}")
-    
-    # 检查输入文件
-    if not os.path.exists(input_csv):
+
+    # 检查输入（优先使用内存数据，避免CSV解析往返）
+    if input_df is None and not os.path.exists(input_csv):
         print_error(f"输入CSV文件不存在: {input_csv}")
         print("请先运行Step1生成CSV文件")
-        return False
-    
-    print(f"输入CSV: {STEP1_OUTPUT_CSV}")
+        return None
+
+    print(f"输入数据: {'Step1内存结果' if input_df is not None else STEP1_OUTPUT_CSV}")
     print(f"输出CSV: {STEP2_OUTPUT_CSV}")
-    
+
+    # 检查缓存（step1输出未变时直接加载已有结果）
+    expected_hash = config_hash([input_csv], ()) if os.path.exists(input_csv) else None
+    if expected_hash and cache_valid([output_csv], expected_hash):
+        print_success(f"Step2命中缓存，直接加载已有结果: {STEP2_OUTPUT_CSV}")
+        return load_table(output_csv)
+
     # 执行计算
     start_time = time.time()
-    compute_indices(
+    df = compute_indices(
         input_csv=input_csv,
         output_csv=output_csv,
-        display_stats=True
+        display_stats=True,
+        input_df=input_df
     )
     elapsed_time = time.time() - start_time
-    
+    if expected_hash:
+        write_cache_hash([output_csv], expected_hash)
+
     print_success(f"Step2完成！耗时: {elapsed_time:.2f}秒")
-    return True
+    return df
 
 
-def step3_visualize():
+def step3_visualize(input_df=None, defer_tasks=None, pending_hashes=None):
     """
     Step3: 生成热力图可视化
-    
-    入参: 无（使用全局配置）
-    
+
+    入参:
+    - input_df (pd.DataFrame): Step2的内存结果，None时回退到读取CSV文件
+    - defer_tasks (list): 非None时不立即执行，将(函数, 参数)加入该队列供并行执行
+    - pending_hashes (list): 配合defer_tasks使用，收集待写入的缓存指纹
+
     方法:
-    - 读取Step2输出的CSV文件
+    - 使用Step2传入的DataFrame（或读取Step2输出的CSV文件）
     - 生成灰度通道热力图（彩虹色）
     - 生成水体掩膜热力图（黑白）
     - 保存为PNG图像
-    
+
     出参:
     - step3_heatmap_visualization.png: 包含灰度和掩膜的热力图
     """
     print_header(3, "生成热力图可视化")
-    
+
     # 构建文件路径
     input_csv = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP2_OUTPUT_CSV}")
     output_png = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP3_OUTPUT_PNG}")
-    
-    # 检查输入文件
-    if not os.path.exists(input_csv):
+
+    # 检查输入（优先使用内存数据，避免CSV解析往返）
+    if input_df is None and not os.path.exists(input_csv):
         print_error(f"输入CSV文件不存在: {input_csv}")
         print("请先运行Step2生成含指数的CSV文件")
         return False
-    
-    print(f"输入CSV: {STEP2_OUTPUT_CSV}")
+
+    print(f"输入数据: {'Step2内存结果' if input_df is not None else STEP2_OUTPUT_CSV}")
     print(f"输出图像: {STEP3_OUTPUT_PNG}")
     print(f"分辨率: {VIS_FIGURE_WIDTH}×{VIS_FIGURE_HEIGHT}英寸 @ {VIS_DPI}DPI")
-    
-    # 执行可视化
-    start_time = time.time()
-    csv_to_heatmap(
+
+    # 检查缓存（step2输出和可视化参数未变时跳过渲染）
+    expected_hash = (config_hash(
+        [input_csv],
+        (VIS_FIGURE_WIDTH, VIS_FIGURE_HEIGHT, VIS_DPI, VIS_CMAP_GRAY, VIS_CMAP_MASK)
+    ) if os.path.exists(input_csv) else None)
+    if expected_hash and cache_valid([output_png], expected_hash):
+        print_success(f"Step3命中缓存，跳过渲染: {STEP3_OUTPUT_PNG}")
+        return True
+
+    # 组装渲染参数
+    heatmap_kwargs = dict(
         input_csv=input_csv,
         output_image=output_png,
         figsize=(VIS_FIGURE_WIDTH, VIS_FIGURE_HEIGHT),
         dpi=VIS_DPI,
         cmap_gray=VIS_CMAP_GRAY,
-        cmap_mask=VIS_CMAP_MASK
+        cmap_mask=VIS_CMAP_MASK,
+        input_df=input_df
     )
+
+    # 并行模式：只登记任务，由main统一在进程池中执行
+    if defer_tasks is not None:
+        defer_tasks.append((csv_to_heatmap, heatmap_kwargs))
+        pending_hashes.append(([output_png], expected_hash))
+        print("→ Step3渲染任务已加入并行队列")
+        return True
+
+    # 串行模式：立即执行可视化
+    start_time = time.time()
+    csv_to_heatmap(**heatmap_kwargs)
     elapsed_time = time.time() - start_time
-    
+    if expected_hash:
+        write_cache_hash([output_png], expected_hash)
+
     print_success(f"Step3完成！耗时: {elapsed_time:.2f}秒")
     return True
 
 
-def step4_csv_to_raster():
+def step4_csv_to_raster(input_df=None, defer_tasks=None, pending_hashes=None):
     """
     Step4: 将CSV转换回栅格影像
-    
-    入参: 无（使用全局配置）
-    
+
+    入参:
+    - input_df (pd.DataFrame): Step2的内存结果，None时回退到读取CSV文件
+    - defer_tasks (list): 非None时不立即执行，将(函数, 参数)加入该队列供并行执行
+    - pending_hashes (list): 配合defer_tasks使用，收集待写入的缓存指纹
+
     方法:
-    - 读取Step2输出的CSV文件
+    - 使用Step2传入的DataFrame（或读取Step2输出的CSV文件）
     - 生成PNG可视化图像（RGB 3波段，uint8）
     - 生成RGB栅格影像（RGBN 4波段，uint8）
     - 生成BOA反射率影像（RGBN 4波段，uint16）
-    
+
     出参:
     - step4_RGB.png: PNG可视化图像
     - step4_RGB.tif: RGB栅格影像（0-255）
     - step4_BOA.tif: BOA反射率影像（0-10000）
     """
     print_header(4, "CSV → 栅格影像（PNG + RGB + BOA）")
-    
+
     # 构建文件路径
     input_csv = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP2_OUTPUT_CSV}")
     output_png = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP4_OUTPUT_PNG}")
     output_rgb = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP4_OUTPUT_RGB}")
     output_boa = get_full_path(f"{INPUT_OUTPUT_DIR}/{STEP4_OUTPUT_BOA}")
-    
-    # 检查输入文件
-    if not os.path.exists(input_csv):
+
+    # 检查输入（优先使用内存数据，避免CSV解析往返）
+    if input_df is None and not os.path.exists(input_csv):
         print_error(f"输入CSV文件不存在: {input_csv}")
         print("请先运行Step2生成含指数的CSV文件")
         return False
-    
-    print(f"输入CSV: {STEP2_OUTPUT_CSV}")
+
+    print(f"输入数据: {'Step2内存结果' if input_df is not None else STEP2_OUTPUT_CSV}")
     print(f"输出文件1: {STEP4_OUTPUT_PNG} (PNG可视化)")
     print(f"输出文件2: {STEP4_OUTPUT_RGB} (RGB栅格)")
     print(f"输出文件3: {STEP4_OUTPUT_BOA} (BOA反射率)")
-    
-    # 执行转换（分3个子步骤）
+
+    # 检查缓存（step2输出和转换参数未变时跳过重新生成）
+    step4_outputs = [output_png, output_rgb, output_boa]
+    expected_hash = (config_hash(
+        [input_csv],
+        (TIFF_BANDS, TIFF_CRS, CLIP_MIN, CLIP_MAX, GAMMA,
+         RESTORE_REFLECTANCE_RGB, RESTORE_REFLECTANCE_BOA)
+    ) if os.path.exists(input_csv) else None)
+    if expected_hash and cache_valid(step4_outputs, expected_hash):
+        print_success(f"Step4命中缓存，跳过重新生成: {STEP4_OUTPUT_PNG} 等3个文件")
+        return True
+
+    # 组装3个子步骤的转换参数（PNG可视化 + RGB栅格uint8 + BOA反射率uint16）
+    sub_tasks = [
+        (csv_to_png, dict(
+            input_csv=input_csv,
+            output_png=output_png,
+            clip_min=CLIP_MIN,
+            clip_max=CLIP_MAX,
+            gamma=GAMMA,
+            input_df=input_df
+        )),
+        (csv_to_geotiff, dict(
+            input_csv=input_csv,
+            output_tiff=output_rgb,
+            bands=TIFF_BANDS,
+            crs=TIFF_CRS,
+            restore_reflectance=RESTORE_REFLECTANCE_RGB,
+            clip_min=CLIP_MIN,
+            clip_max=CLIP_MAX,
+            gamma=GAMMA,
+            input_df=input_df
+        )),
+        (csv_to_geotiff, dict(
+            input_csv=input_csv,
+            output_tiff=output_boa,
+            bands=TIFF_BANDS,
+            crs=TIFF_CRS,
+            restore_reflectance=RESTORE_REFLECTANCE_BOA,
+            clip_min=CLIP_MIN,
+            clip_max=CLIP_MAX,
+            gamma=GAMMA,
+            input_df=input_df
+        )),
+    ]
+
+    # 并行模式：3个写出任务互不冲突，只登记任务，由main统一在进程池中执行
+    if defer_tasks is not None:
+        defer_tasks.extend(sub_tasks)
+        pending_hashes.append((step4_outputs, expected_hash))
+        print("→ Step4的3个写出任务已加入并行队列")
+        return True
+
+    # 串行模式：依次执行3个子步骤
+    sub_messages = [
+        "\n  → 生成PNG可视化图像...",
+        "  → 生成RGB栅格影像（0-255）...",
+        "  → 生成BOA反射率影像（0-10000）...",
+    ]
     start_time = time.time()
-    
-    # 子步骤1: 生成PNG可视化
-    print("\n  → 生成PNG可视化图像...")
-    csv_to_png(
-        input_csv=input_csv,
-        output_png=output_png,
-        clip_min=CLIP_MIN,
-        clip_max=CLIP_MAX,
-        gamma=GAMMA
-    )
-    
-    # 子步骤2: 生成RGB栅格（uint8）
-    print("  → 生成RGB栅格影像（0-255）...")
-    csv_to_geotiff(
-        input_csv=input_csv,
-        output_tiff=output_rgb,
-        bands=TIFF_BANDS,
-        crs=TIFF_CRS,
-        restore_reflectance=RESTORE_REFLECTANCE_RGB,
-        clip_min=CLIP_MIN,
-        clip_max=CLIP_MAX,
-        gamma=GAMMA
-    )
-    
-    # 子步骤3: 生成BOA反射率（uint16）
-    print("  → 生成BOA反射率影像（0-10000）...")
-    csv_to_geotiff(
-        input_csv=input_csv,
-        output_tiff=output_boa,
-        bands=TIFF_BANDS,
-        crs=TIFF_CRS,
-        restore_reflectance=RESTORE_REFLECTANCE_BOA,
-        clip_min=CLIP_MIN,
-        clip_max=CLIP_MAX,
-        gamma=GAMMA
-    )
-    
+    rgb_cube = None
+    for message, (task_fn, task_kwargs) in zip(sub_messages, sub_tasks):
+        print(message)
+        # RGB与BOA两次转换只差restore_reflectance，复用已填充的像素立方体
+        if task_fn is csv_to_geotiff and rgb_cube is not None:
+            task_kwargs['rgb_cube'] = rgb_cube
+        result = task_fn(**task_kwargs)
+        if task_fn is csv_to_geotiff:
+            rgb_cube = result
     elapsed_time = time.time() - start_time
+    if expected_hash:
+        write_cache_hash(step4_outputs, expected_hash)
+
     print_success(f"Step4完成！耗时: {elapsed_time:.2f}秒")
     return True
 
 
-def main():
+def parse_step_selection():
+    """
+    解析命令行参数，确定要执行的步骤集合
+
+    入参: 命令行参数（--from/--to/--only）
+
+    方法:
+    - --only优先：逗号分隔的步骤编号（如 "3" 或 "3,4"）
+    - 否则取[--from, --to]的连续区间（默认1-4）
+    - 未被选中的步骤回退到读取上一步落盘的CSV/Parquet
+
+    出参:
+    - selected (list): 升序的步骤编号列表
+    """
+    parser = argparse.ArgumentParser(description='遥感影像处理完整流程启动器（Step1-4）')
+    parser.add_argument('--from', dest='from_step', type=int, choices=[1, 2, 3, 4], default=1,
+                        help='起始步骤编号，默认1')
+    parser.add_argument('--to', dest='to_step', type=int, choices=[1, 2, 3, 4], default=4,
+                        help='结束步骤编号，默认4')
+    parser.add_argument('--only', type=str, default=None,
+                        help='只执行指定步骤（逗号分隔，如 "3" 或 "3,4"），优先于--from/--to')
+    args = parser.parse_args()
+
+    if args.only:
+        selected = sorted({int(s) for s in args.only.split(',')})
+        invalid = [s for s in selected if s not in (1, 2, 3, 4)]
+        if invalid:
+            parser.error(f"--only包含无效的步骤编号: {invalid}")
+        return selected
+
+    if args.from_step > args.to_step:
+        parser.error(f"--from ({args.from_step}) 不能大于 --to ({args.to_step})")
+    return list(range(args.from_step, args.to_step + 1))
+
+
+def main(selected_steps=None):
     """
     主函数 - 执行完整的4步处理流程
-    
-    入参: 无
-    
+
+    入参:
+    - selected_steps (list): 要执行的步骤编号列表，None时执行全部4步
+
     方法:
     - 打印欢迎信息和配置概览
-    - 顺序执行Step1到Step4
+    - 顺序执行选中的步骤（默认Step1到Step4）
     - 显示最终处理报告
-    
+
     出参: 无
     """
+    if selected_steps is None:
+        selected_steps = [1, 2, 3, 4]
+
     # 打印欢迎信息
     print("="*70)
     print("遥感影像处理完整流程启动器".center(70))
@@ -402,40 +628,89 @@ def main():
     print(f"反射率范围: {CLIP_MIN} - {CLIP_MAX}")
     print(f"Gamma校正: γ = {GAMMA}")
     print(f"坐标系: {TIFF_CRS}")
-    
+
+    skipped_steps = [s for s in (1, 2, 3, 4) if s not in selected_steps]
+    if skipped_steps:
+        print(f"\n⏭️  跳过步骤: {', '.join(f'Step{s}' for s in skipped_steps)}"
+              f"（被跳过的步骤使用已落盘的结果）")
+
     # 记录总开始时间
     total_start_time = time.time()
-    
-    # 执行各个步骤
+
+    # 执行各个步骤（步骤间直接传递DataFrame，CSV只作为落盘产物）
     success_count = 0
-    
+    step1_df = None
+    step2_df = None
+
     # Step1: TIFF → CSV
-    if step1_tiff_to_csv():
-        success_count += 1
-    else:
-        print_error("Step1执行失败，流程中止")
-        return
-    
+    if 1 in selected_steps:
+        step1_df = step1_tiff_to_csv()
+        if step1_df is not None:
+            success_count += 1
+        else:
+            print_error("Step1执行失败，流程中止")
+            return
+
     # Step2: 计算指数
-    if step2_compute_indices():
-        success_count += 1
+    if 2 in selected_steps:
+        step2_df = step2_compute_indices(input_df=step1_df)
+        if step2_df is not None:
+            success_count += 1
+        else:
+            print_error("Step2执行失败，流程中止")
+            return
+
+    run_step3 = 3 in selected_steps
+    run_step4 = 4 in selected_steps
+
+    # Step3/Step4: 可视化与栅格输出（4个写出任务互不冲突，可并行执行）
+    if PARALLEL_OUTPUTS and run_step3 and run_step4:
+        defer_tasks, pending_hashes = [], []
+        step3_ok = step3_visualize(input_df=step2_df, defer_tasks=defer_tasks,
+                                   pending_hashes=pending_hashes)
+        step4_ok = step4_csv_to_raster(input_df=step2_df, defer_tasks=defer_tasks,
+                                       pending_hashes=pending_hashes)
+        if not step3_ok:
+            print_error("Step3执行失败，流程中止")
+            return
+        if not step4_ok:
+            print_error("Step4执行失败，流程中止")
+            return
+        if defer_tasks:
+            print(f"\n并行执行 {len(defer_tasks)} 个输出任务"
+                  f"（最多{PARALLEL_MAX_WORKERS}个进程）...")
+            parallel_start_time = time.time()
+            # spawn上下文：避免fork继承父进程中numba/GDAL已启动的线程状态
+            with ProcessPoolExecutor(
+                max_workers=PARALLEL_MAX_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_parallel_worker
+            ) as executor:
+                futures = [executor.submit(task_fn, **task_kwargs)
+                           for task_fn, task_kwargs in defer_tasks]
+                for future in futures:
+                    future.result()
+            for outputs, expected_hash in pending_hashes:
+                if expected_hash:
+                    write_cache_hash(outputs, expected_hash)
+            print_success(f"Step3/Step4并行完成！耗时: {time.time() - parallel_start_time:.2f}秒")
+        success_count += 2
     else:
-        print_error("Step2执行失败，流程中止")
-        return
-    
-    # Step3: 可视化
-    if step3_visualize():
-        success_count += 1
-    else:
-        print_error("Step3执行失败，流程中止")
-        return
-    
-    # Step4: CSV → 栅格
-    if step4_csv_to_raster():
-        success_count += 1
-    else:
-        print_error("Step4执行失败，流程中止")
-        return
+        # Step3: 可视化
+        if run_step3:
+            if step3_visualize(input_df=step2_df):
+                success_count += 1
+            else:
+                print_error("Step3执行失败，流程中止")
+                return
+
+        # Step4: CSV → 栅格
+        if run_step4:
+            if step4_csv_to_raster(input_df=step2_df):
+                success_count += 1
+            else:
+                print_error("Step4执行失败，流程中止")
+                return
     
     # 计算总耗时
     total_elapsed_time = time.time() - total_start_time
@@ -444,7 +719,7 @@ def main():
     print("\n" + "="*70)
     print("处理完成报告".center(70))
     print("="*70)
-    print(f"\n✅ 成功完成 {success_count}/4 个步骤")
+    print(f"\n✅ 成功完成 {success_count}/{len(selected_steps)} 个步骤")
     print(f"⏱️  总耗时: {total_elapsed_time:.2f}秒")
     
     print("\n【生成的文件】")
@@ -475,6 +750,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(selected_steps=parse_step_selection())
 
 
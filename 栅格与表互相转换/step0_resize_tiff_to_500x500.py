@@ -20,7 +20,7 @@ TIFF 图像尺寸调整器 - 调整为500x500像素
 import rasterio
 from rasterio.enums import Resampling
 from rasterio.transform import Affine
-import numpy as np
+from rasterio.vrt import WarpedVRT
 import os
 
 # ==================== 全局配置参数 ====================
@@ -42,6 +42,11 @@ RESAMPLING_METHOD = Resampling.bilinear  # 双线性插值：平衡质量和速
 
 # GeoTIFF配置
 COMPRESSION_TYPE = 'lzw'              # GeoTIFF压缩类型：LZW无损压缩
+TILE_BLOCK_SIZE = 256                 # 内部分块大小：256x256（便于后续按块读取）
+PREDICTOR_INT = 2                     # LZW预测器：整型数据用水平差分
+PREDICTOR_FLOAT = 3                   # LZW预测器：浮点数据用浮点差分
+NUM_THREADS = 'ALL_CPUS'              # GDAL压缩/解压线程数
+BIGTIFF_MODE = 'IF_SAFER'             # 超过4GB时自动切换BigTIFF
 
 # 输出文件后缀
 OUTPUT_SUFFIX = '_resized_500x500.tif'  # 输出文件后缀
@@ -108,48 +113,49 @@ def resize_tiff_to_500x500(input_path, output_path=None):
         print(f"  原始: {original_transform}")
         print(f"  新的: {new_transform}")
         
-        # ④ 创建输出数组并重采样所有波段
-        print(f"\n正在重采样到 {TARGET_WIDTH}x{TARGET_HEIGHT} 像素...")
-        
-        # 创建目标数组（形状：波段数 x 高度 x 宽度）
-        output_data = np.zeros((band_count, TARGET_HEIGHT, TARGET_WIDTH), dtype=src.dtypes[0])
-        
-        # 对每个波段进行重采样
-        for band_idx in range(1, band_count + 1):
-            print(f"  处理波段 {band_idx}/{band_count}...")
-            
-            # 使用rasterio的read方法直接重采样
-            output_data[band_idx - 1] = src.read(
-                band_idx,
-                out_shape=(TARGET_HEIGHT, TARGET_WIDTH),
-                resampling=RESAMPLING_METHOD
-            )
-        
-        # ⑤ 保存输出文件
+        # ④ 确定输出路径
         # 如果未指定输出路径，则使用全局配置的输出目录
         if output_path is None:
             input_name = os.path.splitext(os.path.basename(input_path))[0]
             output_path = os.path.join(OUTPUT_DIR, f"{input_name}{OUTPUT_SUFFIX}")
-        
-        print(f"\n正在保存到: {output_path}")
-        
+
         # 更新元数据
+        # 根据数据类型选择LZW预测器（浮点用3，整型用2），显著提升压缩率
+        predictor = PREDICTOR_FLOAT if src.dtypes[0].startswith('float') else PREDICTOR_INT
+
         output_meta = src.meta.copy()
         output_meta.update({
             'width': TARGET_WIDTH,
             'height': TARGET_HEIGHT,
             'transform': new_transform,
-            'compress': COMPRESSION_TYPE
+            'compress': COMPRESSION_TYPE,
+            'predictor': predictor,
+            'tiled': True,
+            'blockxsize': TILE_BLOCK_SIZE,
+            'blockysize': TILE_BLOCK_SIZE,
+            'num_threads': NUM_THREADS,
+            'bigtiff': BIGTIFF_MODE
         })
-        
-        # 写入输出文件
+
+        # ⑤ 重采样并流式写出
+        # WarpedVRT在目标网格上按需重采样，按输出文件的内部分块逐块读写，
+        # 内存占用从整幅影像降为单个数据块，源影像再大也不会撑爆内存
+        print(f"\n正在重采样到 {TARGET_WIDTH}x{TARGET_HEIGHT} 像素并保存到: {output_path}")
+
         with rasterio.open(output_path, 'w', **output_meta) as dst:
-            dst.write(output_data)
-            
+            with WarpedVRT(src, crs=src.crs, width=TARGET_WIDTH, height=TARGET_HEIGHT,
+                           transform=new_transform, resampling=RESAMPLING_METHOD) as vrt:
+                block_count = 0
+                for _, window in dst.block_windows(1):
+                    dst.write(vrt.read(window=window), window=window)
+                    block_count += 1
+
             # 复制波段描述信息
             for band_idx in range(1, band_count + 1):
                 if src.descriptions[band_idx - 1]:
                     dst.set_band_description(band_idx, src.descriptions[band_idx - 1])
+
+        print(f"  已按 {block_count} 个数据块完成 {band_count} 个波段的流式重采样")
         
         print(f"\n✅ 处理完成!")
         print(f"输出文件: {output_path}")
@@ -21,11 +21,27 @@ GeoTIFF RGB+近红外波段数据提取器
 import numpy as np
 import pandas as pd
 import rasterio
-from rasterio.transform import xy
+from rasterio.enums import Resampling
 from PIL import Image
 import argparse
 import os
-from tqdm import tqdm
+from functools import lru_cache
+
+# Numba为可选依赖：存在时使用并行融合核做浮点波段的RGB转换，否则回退到NumPy向量化
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# CuPy为可选依赖：有可用GPU时大尺寸浮点波段的RGB转换走CUDA单次内核
+# （导入或设备枚举失败都视为无GPU，除ImportError外还可能抛CUDA运行时异常）
+try:
+    import cupy as cp
+    CUPY_AVAILABLE = cp.cuda.runtime.getDeviceCount() > 0
+except Exception:
+    cp = None
+    CUPY_AVAILABLE = False
 
 # ==================== 全局配置参数 ====================
 # 入参配置 - convert_to_rgb_255函数
@@ -38,6 +54,7 @@ DEFAULT_BAND_ORDER = ['B4', 'B3', 'B2', 'B8']  # 默认波段顺序：红绿蓝
 DEFAULT_CONVERT_RGB = True             # 是否将RGBN转换为0-255范围
 DEFAULT_SAVE_CLIPPED_TIFF = True       # 是否保存处理后的原始影像
 DEFAULT_STRETCH_255 = True             # 是否在转换后再拉伸到完整0-255范围
+DEFAULT_SPARSE_OUTPUT = False          # 是否只输出掩膜内(water_mask=1)的像素行
 
 # 反射率转换参数
 REFLECTANCE_SCALE = 10000.0            # 反射率缩放因子：0-10000范围
@@ -65,39 +82,221 @@ BAND_DESC_GREEN_RGB = 'Green (0-255)'
 BAND_DESC_BLUE_RGB = 'Blue (0-255)'
 BAND_DESC_NIR_RGB = 'NIR (0-255)'
 
-# GeoTIFF配置
-COMPRESSION_TYPE = 'lzw'               # GeoTIFF压缩类型
+# GeoTIFF配置（zstd+水平差分预测+内部分块：写出更快、文件更小，且利于窗口化读取）
+COMPRESSION_TYPE = 'zstd'              # GeoTIFF压缩类型
+ZSTD_LEVEL = 3                         # zstd压缩级别（3为速度/压缩比平衡点）
+PREDICTOR_INT = 2                      # 整型波段水平差分预测器（提升相邻像素压缩比）
+TILE_BLOCK_SIZE = 256                  # 内部分块尺寸
+NUM_THREADS = 'ALL_CPUS'               # GDAL压缩线程数
+BIGTIFF_MODE = 'IF_SAFER'              # 超4GB时自动切换BigTIFF
 
 # CSV列名配置
 CSV_COL_WATER_MASK = 'water_mask'      # 水体掩膜列名
 
+# 输出精度配置（降低列宽度以缩小文件体积、加快下游读取）
+DOWNCAST_OUTPUT = True                 # 是否在保存前降低波段列精度（uint8/uint16/float32）
+CSV_FLOAT_FORMAT = '%.8f'              # CSV浮点列格式（8位小数，约1mm级经纬度精度）
+CSV_WRITE_CHUNKSIZE = 1_000_000        # CSV分块写出行数（限制文本格式化缓冲的峰值内存）
+
+# Parquet伴随文件配置（二进制列式存储，下游读取远快于CSV文本解析）
+WRITE_PARQUET = True                   # 是否在CSV旁额外保存Parquet文件
+PARQUET_SUFFIX = '.parquet'            # Parquet文件后缀
+PARQUET_COMPRESSION = 'zstd'           # Parquet压缩算法
+
+# GPU配置
+GPU_MIN_PIXELS = 1_000_000             # 启用GPU转换的最小像素数（低于此值PCIe传输开销占主导）
+
+# NumPy伴随文件配置（无压缩列存档，按列惰性读取，不依赖pyarrow）
+WRITE_NPZ = True                       # 是否在CSV旁额外保存.npz文件
+NPZ_SUFFIX = '.npz'                    # NumPy存档文件后缀
+
 # 出参说明
 # convert_to_rgb_255 返回: numpy.ndarray (uint8) - RGB值(0-255)
 # extract_bands_to_csv 返回: 无（直接保存CSV和GeoTIFF文件）
 # extract_bands_to_csv_with_mask 返回: 无（直接保存CSV和GeoTIFF文件，包含water_mask列）
 # ====================================================
 
+def save_table(df, output_path):
+    """
+    保存数据表为CSV，并可选地在旁边保存Parquet伴随文件
+
+    入参:
+    - df (pd.DataFrame): 待保存的数据表
+    - output_path (str): 输出CSV文件路径
+
+    方法:
+    ① 保存CSV文件（面向用户的文本产物）
+    ② 若启用WRITE_PARQUET，在同目录保存同名.parquet文件
+       （zstd压缩的二进制列式格式，step2-4重新读取时优先加载、跳过文本解析；
+       CSV仅作为面向用户的文本产物保留固定小数位格式）
+    ③ 若启用WRITE_NPZ，在同目录保存同名.npz文件
+       （每列一个数组成员，下游只按需读取用到的列）
+
+    出参:
+    - 无（直接保存文件）
+    """
+    df.to_csv(output_path, index=False, float_format=CSV_FLOAT_FORMAT,
+              chunksize=CSV_WRITE_CHUNKSIZE)
+
+    if WRITE_PARQUET:
+        parquet_path = os.path.splitext(output_path)[0] + PARQUET_SUFFIX
+        try:
+            df.to_parquet(parquet_path, engine='pyarrow', compression=PARQUET_COMPRESSION)
+            print(f"✓ Parquet伴随文件已保存: {parquet_path}")
+        except ImportError:
+            print(f"⚠️  未安装pyarrow，跳过Parquet伴随文件")
+
+    if WRITE_NPZ:
+        npz_path = os.path.splitext(output_path)[0] + NPZ_SUFFIX
+        np.savez(npz_path, **{col: df[col].to_numpy() for col in df.columns})
+        print(f"✓ NumPy伴随文件已保存: {npz_path}")
+
+
+@lru_cache(maxsize=8)
+def build_gamma_lut(clip_min, clip_max, gamma):
+    """
+    构建DN值(0-10000)到RGB值(0-255)的查找表
+
+    入参:
+    - clip_min (float): 反射率裁剪下限
+    - clip_max (float): 反射率裁剪上限
+    - gamma (float): Gamma校正系数
+
+    方法:
+    ① 对0-10000的每个DN值预计算"裁剪→归一化→Gamma校正→缩放255"的结果
+    ② 结果缓存（lru_cache），同一组参数只计算一次
+    ③ 整型波段可直接用 lut[band] 查表，替代逐像素的np.power和浮点除法
+
+    出参:
+    - np.ndarray: 形状(10001,)的uint8查找表
+    """
+    dn = np.arange(int(REFLECTANCE_SCALE) + 1, dtype=np.float64)
+    reflectance = np.clip(dn / REFLECTANCE_SCALE, clip_min, clip_max)
+    normalized = (reflectance - clip_min) / (clip_max - clip_min)
+    return (np.power(normalized, 1.0 / gamma) * RGB_MAX_VALUE).astype(OUTPUT_DTYPE_RGB)
+
+
+@lru_cache(maxsize=8)
+def build_gamma_lut_uint16(clip_min, clip_max, gamma):
+    """
+    构建uint16全值域(0-65535)到RGB值(0-255)的查找表
+
+    入参:
+    - clip_min (float): 反射率裁剪下限
+    - clip_max (float): 反射率裁剪上限
+    - gamma (float): Gamma校正系数
+
+    方法:
+    ① 覆盖uint16全部65536个码值：超出10000的DN在反射率裁剪中自然饱和到clip_max
+    ② uint16波段无需预先np.clip即可直接lut[band]查表，每像素只剩一次gather
+    ③ 结果缓存（lru_cache），同一组参数只计算一次
+
+    出参:
+    - np.ndarray: 形状(65536,)的uint8查找表
+    """
+    dn = np.arange(65536, dtype=np.float32)
+    reflectance = np.clip(dn / np.float32(REFLECTANCE_SCALE), clip_min, clip_max)
+    normalized = (reflectance - clip_min) / (clip_max - clip_min)
+    return (np.power(normalized, 1.0 / gamma) * RGB_MAX_VALUE).astype(OUTPUT_DTYPE_RGB)
+
+
+if CUPY_AVAILABLE:
+    # 浮点波段RGB转换CUDA核：缩放→裁剪→归一化→Gamma→量化在单次内核启动中完成，
+    # 四个波段的立方体一次提交，总耗时以PCIe往返为主
+    gamma_rgb_gpu = cp.ElementwiseKernel(
+        'T x, float32 inv_scale, float32 lo, float32 hi, float32 inv_range, float32 inv_gamma',
+        'uint8 y',
+        '''
+        float v = x * inv_scale;
+        v = fminf(fmaxf(v, lo), hi);
+        v = (v - lo) * inv_range;
+        y = (unsigned char)(powf(v, inv_gamma) * 255.0f);
+        ''',
+        'gamma_rgb_255'
+    )
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def gamma_rgb_kernel(band, inv_scale, clip_min, clip_max, inv_range, inv_gamma, out):
+        """
+        浮点波段RGB转换融合核（Numba并行）
+
+        入参:
+        - band (np.ndarray): 连续float32波段数组（0-10000反射率）
+        - inv_scale/clip_min/clip_max/inv_range/inv_gamma (float): 预计算的转换参数
+        - out (np.ndarray): 预分配的uint8输出数组
+
+        方法:
+        - 单次遍历完成缩放→裁剪→归一化→Gamma→量化：每像素读一次写一次
+        - 与分步的NumPy表达式相比省去5个中间float数组的内存往返
+
+        出参:
+        - 无（结果写入out）
+        """
+        for i in prange(band.shape[0]):
+            for j in range(band.shape[1]):
+                v = band[i, j] * inv_scale
+                if v < clip_min:
+                    v = clip_min
+                elif v > clip_max:
+                    v = clip_max
+                v = (v - clip_min) * inv_range
+                out[i, j] = np.uint8(v ** inv_gamma * 255.0)
+
+
+def stretch_bands_255(rgb_255):
+    """
+    将uint8波段的实际范围线性拉伸到完整0-255（原地修改）
+
+    入参:
+    - rgb_255 (np.ndarray): uint8波段数组，二维(H,W)或三维(B,H,W)
+
+    方法:
+    ① 逐波段计算实际min/max（uint8域单次归约，代价远低于浮点转换）
+    ② 有动态范围时用256条目查表一次完成线性拉伸，
+       省去float32转换→缩放→回转uint8的三次全量遍历
+
+    出参:
+    - np.ndarray: 拉伸后的数组（与入参同一块内存）
+    """
+    bands_view = rgb_255 if rgb_255.ndim == 3 else rgb_255[np.newaxis]
+    for b in range(bands_view.shape[0]):
+        actual_min = int(bands_view[b].min())
+        actual_max = int(bands_view[b].max())
+
+        if actual_max > actual_min:
+            codes = np.arange(256, dtype=np.float32)
+            stretch_lut = ((codes - actual_min) / (actual_max - actual_min)
+                           * RGB_MAX_VALUE).clip(0, RGB_MAX_VALUE).astype(OUTPUT_DTYPE_RGB)
+            bands_view[b] = stretch_lut[bands_view[b]]
+    return rgb_255
+
+
 def convert_to_rgb_255(band_array, clip_min=None, clip_max=None, gamma=None, stretch_255=None):
     """
     将反射率转换为RGB 0-255范围（标准遥感影像处理流程）
-    
+
     入参:
-    - band_array (np.ndarray): 输入波段数组（反射率值，通常0-10000）
+    - band_array (np.ndarray): 输入波段数组（反射率值，通常0-10000），
+      二维单波段(H,W)或三维多波段(B,H,W)；多波段时一次调用批量转换，
+      Python调度与数组扫描开销只付一次
     - clip_min (float): 反射率下限，None时使用全局DEFAULT_CLIP_MIN
     - clip_max (float): 反射率上限，None时使用全局DEFAULT_CLIP_MAX
     - gamma (float): Gamma校正系数，None时使用全局DEFAULT_GAMMA
     - stretch_255 (bool): 是否在转换后再拉伸到完整0-255范围，None时使用全局DEFAULT_STRETCH_255
     
     方法:
-    ① 将0-10000范围转换为0-1反射率
+    ① 整型DN输入：直接查预计算的Gamma查找表（免逐像素pow/除法）
+       浮点输入：将0-10000范围转换为0-1反射率
     ② 裁剪到有效反射率范围（clip_min ~ clip_max）
     ③ Min-Max拉伸到0-1
     ④ 应用Gamma校正（γ=2.2）增强显示效果
     ⑤ 缩放到0-255并转为uint8
-    ⑥ (可选) 按255比例拉伸：将实际范围拉伸到完整0-255
-    
+    ⑥ (可选) 按255比例拉伸：将实际范围拉伸到完整0-255（多波段时逐波段独立拉伸）
+
     出参:
-    - np.ndarray: RGB值（0-255，uint8类型）
+    - np.ndarray: RGB值（0-255，uint8类型，形状与输入一致）
     """
     # 使用全局默认值
     if clip_min is None:
@@ -108,39 +307,68 @@ def convert_to_rgb_255(band_array, clip_min=None, clip_max=None, gamma=None, str
         gamma = DEFAULT_GAMMA
     if stretch_255 is None:
         stretch_255 = DEFAULT_STRETCH_255
-    
-    # ① 转换为0-1反射率（假设输入是0-10000范围）
-    reflectance = band_array / REFLECTANCE_SCALE
-    
-    # ② 裁剪到有效范围（增强层次，去掉极暗与极亮）
-    reflectance = np.clip(reflectance, clip_min, clip_max)
-    
-    # ③ Min-Max拉伸到0-1
-    normalized = (reflectance - clip_min) / (clip_max - clip_min)
-    
-    # ④ Gamma校正（应用1/gamma增强对比度）
-    gamma_corrected = np.power(normalized, 1.0 / gamma)
-    
-    # ⑤ 缩放到0-255
-    rgb_255 = (gamma_corrected * RGB_MAX_VALUE).astype(OUTPUT_DTYPE_RGB)
-    
-    # ⑥ 按255比例拉伸（增强对比度）
+
+    band_array = np.asarray(band_array)
+
+    if band_array.dtype == np.uint16:
+        # ①-⑤ uint16路径：全值域查找表免去预先np.clip的一次全量遍历，
+        # 每像素只剩一次gather（常见的Sentinel-2 DN输入即此类型）
+        lut = build_gamma_lut_uint16(clip_min, clip_max, gamma)
+        rgb_255 = lut[band_array]
+    elif np.issubdtype(band_array.dtype, np.integer):
+        # ①-⑤ 其余整型DN路径（可能含负值/超界）：裁剪后查10001条目表
+        lut = build_gamma_lut(clip_min, clip_max, gamma)
+        rgb_255 = lut[np.clip(band_array, 0, int(REFLECTANCE_SCALE))]
+    elif CUPY_AVAILABLE and band_array.size >= GPU_MIN_PIXELS:
+        # ①-⑤ 浮点路径（CuPy）：大尺寸数组上传GPU，单次内核完成全部转换后取回
+        band_gpu = cp.asarray(band_array, dtype=cp.float32)
+        rgb_255 = cp.asnumpy(gamma_rgb_gpu(
+            band_gpu,
+            np.float32(1.0 / REFLECTANCE_SCALE),
+            np.float32(clip_min),
+            np.float32(clip_max),
+            np.float32(1.0 / (clip_max - clip_min)),
+            np.float32(1.0 / gamma)
+        ))
+    elif NUMBA_AVAILABLE:
+        # ①-⑤ 浮点路径（Numba）：融合核单次遍历完成全部转换
+        # 逐像素运算与位置无关：三维(B,H,W)折叠为(B*H,W)视图送入二维核
+        band_f32 = np.ascontiguousarray(band_array, dtype=np.float32)
+        rgb_255 = np.empty(band_f32.shape, dtype=OUTPUT_DTYPE_RGB)
+        gamma_rgb_kernel(band_f32.reshape(-1, band_f32.shape[-1]),
+                         1.0 / REFLECTANCE_SCALE, clip_min, clip_max,
+                         1.0 / (clip_max - clip_min), 1.0 / gamma,
+                         rgb_255.reshape(-1, rgb_255.shape[-1]))
+    else:
+        # ① 转换为0-1反射率（假设输入是0-10000范围）
+        # 全程float32：8位输出下float64精度无收益，却要搬运双倍字节
+        reflectance = band_array.astype(np.float32, copy=True)
+        np.multiply(reflectance, np.float32(1.0 / REFLECTANCE_SCALE), out=reflectance)
+
+        # ② 裁剪到有效范围（增强层次，去掉极暗与极亮）
+        # 用min/max这对纯ufunc原地裁剪：比np.clip的通用路径快且不产生临时数组
+        np.maximum(reflectance, np.float32(clip_min), out=reflectance)
+        np.minimum(reflectance, np.float32(clip_max), out=reflectance)
+
+        # ③-⑤ Min-Max拉伸→Gamma校正→缩放255：全程out=复用同一块缓冲
+        # （分步表达式每步都会分配一个全尺寸float临时数组，这里只保留一块）
+        np.subtract(reflectance, np.float32(clip_min), out=reflectance)
+        np.multiply(reflectance, np.float32(1.0 / (clip_max - clip_min)), out=reflectance)
+        np.power(reflectance, np.float32(1.0 / gamma), out=reflectance)
+        np.multiply(reflectance, np.float32(RGB_MAX_VALUE), out=reflectance)
+        rgb_255 = reflectance.astype(OUTPUT_DTYPE_RGB)
+
+    # ⑥ 按255比例拉伸（增强对比度）：多波段时逐波段独立计算范围并拉伸
     if stretch_255:
-        # 计算当前实际范围
-        actual_min = rgb_255.min()
-        actual_max = rgb_255.max()
-        
-        # 如果有动态范围，则拉伸到完整0-255
-        if actual_max > actual_min:
-            # 线性拉伸到0-255
-            rgb_255 = ((rgb_255.astype(np.float32) - actual_min) / (actual_max - actual_min) * RGB_MAX_VALUE).astype(OUTPUT_DTYPE_RGB)
-    
+        stretch_bands_255(rgb_255)
+
     return rgb_255
 
 
-def extract_bands_to_csv(input_path, output_path, band_order=None, 
+def extract_bands_to_csv(input_path, output_path, band_order=None,
                          convert_rgb=None, clip_min=None, clip_max=None, gamma=None,
-                         save_clipped_tiff=None, stretch_255=None):
+                         save_clipped_tiff=None, stretch_255=None, pixel_mask=None,
+                         overview_level=None):
     """
     从GeoTIFF文件提取RGB和近红外波段数据并保存为CSV
     
@@ -154,18 +382,51 @@ def extract_bands_to_csv(input_path, output_path, band_order=None,
     - gamma (float): Gamma校正系数，None时使用全局DEFAULT_GAMMA
     - save_clipped_tiff (bool): 是否保存处理后的原始影像，None时使用全局DEFAULT_SAVE_CLIPPED_TIFF
     - stretch_255 (bool): 是否在转换后再拉伸到完整0-255范围，None时使用全局DEFAULT_STRETCH_255
-    
+    - pixel_mask (np.ndarray): 可选的二维布尔掩膜，非None时只输出掩膜内的像素行
+    - overview_level (int): 可选的预览抽稀级别，N表示按2^N倍降采样读取
+      （利用GDAL金字塔/平均重采样，I/O与下游计算各降为1/4^N，用于快速QA预览）
+
     方法:
-    - 使用rasterio读取GeoTIFF文件
-    - 提取整个图像的所有像素
-    - 保存处理后的原始影像（保持原始反射率值）
-    - 提取每个像素的经纬度坐标
-    - 将RGB和近红外波段转换为0-255标准范围
-    - 应用反射率裁剪和Gamma校正
-    - 按255比例拉伸以增强对比度
-    
+    - 按GeoTIFF内部块窗口流式读取并逐窗转换（峰值内存与影像整体尺寸无关）
+    - 将RGB和近红外波段转换为0-255标准范围（反射率裁剪+Gamma校正+255拉伸）
+    - 保存处理后的原始影像（保持原始反射率值，与读取共用同一窗口遍历）
+    - 用布尔掩膜选出有效像素（pixel_mask ∩ 非NaN），np.nonzero得到行列索引
+    - 向量化仿射变换批量计算经纬度，扁平数组一次性构造DataFrame
+      （全程无逐像素Python循环）
+
     出参:
-    - 无（直接保存CSV文件和处理后的GeoTIFF文件）
+    - pd.DataFrame: 提取结果（同时保存CSV文件和处理后的GeoTIFF文件）
+    """
+    print(f"正在读取文件: {input_path}")
+
+    # 打开GeoTIFF文件（核心实现接收已打开的数据集，便于掩膜流程复用句柄）
+    with rasterio.open(input_path) as src:
+        return _extract_bands_from_dataset(
+            src, output_path,
+            band_order=band_order, convert_rgb=convert_rgb,
+            clip_min=clip_min, clip_max=clip_max, gamma=gamma,
+            save_clipped_tiff=save_clipped_tiff, stretch_255=stretch_255,
+            pixel_mask=pixel_mask, overview_level=overview_level
+        )
+
+
+def _extract_bands_from_dataset(src, output_path, band_order=None,
+                                convert_rgb=None, clip_min=None, clip_max=None,
+                                gamma=None, save_clipped_tiff=None, stretch_255=None,
+                                pixel_mask=None, overview_level=None):
+    """
+    从已打开的rasterio数据集提取波段数据（extract_bands_to_csv的核心实现）
+
+    入参:
+    - src (rasterio.DatasetReader): 已打开的GeoTIFF数据集
+    - 其余参数含义同extract_bands_to_csv
+
+    方法:
+    - 复用调用方持有的数据集句柄：掩膜流程中提取与掩膜对齐共用一次打开，
+      避免二次解析IFD/元数据
+
+    出参:
+    - pd.DataFrame: 提取结果（同时保存CSV文件和处理后的GeoTIFF文件）
     """
     # 使用全局默认值
     if band_order is None:
@@ -182,200 +443,283 @@ def extract_bands_to_csv(input_path, output_path, band_order=None,
         save_clipped_tiff = DEFAULT_SAVE_CLIPPED_TIFF
     if stretch_255 is None:
         stretch_255 = DEFAULT_STRETCH_255
-    
-    print(f"正在读取文件: {input_path}")
-    
-    # 打开GeoTIFF文件
-    with rasterio.open(input_path) as src:
-        # 读取所有波段数据
-        bands_data = src.read()  # 形状为 (bands, height, width)
-        height, width = bands_data.shape[1], bands_data.shape[2]
-        
-        print(f"文件信息:")
-        print(f"  波段数量: {src.count}")
-        print(f"  影像尺寸: {width} x {height}")
-        print(f"  数据类型: {src.dtypes}")
-        print(f"  坐标系: {src.crs}")
-        print(f"  地理变换: {src.transform}")
-        
-        # 验证波段数量
-        if src.count != EXPECTED_BAND_COUNT:
-            raise ValueError(f"期望{EXPECTED_BAND_COUNT}个波段，但文件包含{src.count}个波段")
-        
-        # 按照指定顺序提取波段
-        red_band_raw = bands_data[RED_BAND_INDEX]      # B4 - 红波段
-        green_band_raw = bands_data[GREEN_BAND_INDEX]  # B3 - 绿波段  
-        blue_band_raw = bands_data[BLUE_BAND_INDEX]    # B2 - 蓝波段
-        nir_band = bands_data[NIR_BAND_INDEX]          # B8 - 近红外波段
-        
-        print(f"波段顺序: {band_order}")
-        print(f"  波段1 ({band_order[0]}): 红波段, 原始范围: {red_band_raw.min():.3f} - {red_band_raw.max():.3f}")
-        print(f"  波段2 ({band_order[1]}): 绿波段, 原始范围: {green_band_raw.min():.3f} - {green_band_raw.max():.3f}")
-        print(f"  波段3 ({band_order[2]}): 蓝波段, 原始范围: {blue_band_raw.min():.3f} - {blue_band_raw.max():.3f}")
-        print(f"  波段4 ({band_order[3]}): 近红外波段, 原始范围: {nir_band.min():.3f} - {nir_band.max():.3f}")
-        
-        print("\n正在提取数据...")
-        
-        # 创建数据列表
-        data_list = []
-        
-        # 处理整个图像区域
-        start_i = 0
-        end_i = height
-        start_j = 0
-        end_j = width
-        
-        # 使用整个图像数据
-        red_band_clipped = red_band_raw
-        green_band_clipped = green_band_raw
-        blue_band_clipped = blue_band_raw
-        nir_band_clipped = nir_band
-        
-        # 转换RGBN到0-255范围
+
+    height, width = src.height, src.width
+
+    print(f"文件信息:")
+    print(f"  波段数量: {src.count}")
+    print(f"  影像尺寸: {width} x {height}")
+    print(f"  数据类型: {src.dtypes}")
+    print(f"  坐标系: {src.crs}")
+    print(f"  地理变换: {src.transform}")
+
+    # 存储布局检测：窗口遍历用block_windows与内部块对齐，
+    # 分块(tiled)与条带(striped)布局都不会重复解压同一块数据
+    block_h, block_w = src.block_shapes[0]
+    is_tiled = bool(src.profile.get('tiled', False))
+    print(f"  存储布局: {'内部分块' if is_tiled else '条带'} "
+          f"(块尺寸: {block_w} x {block_h})")
+    if not is_tiled and block_h == 1:
+        print(f"  ⚠️  单行条带布局：窗口退化为逐行读取，大影像建议改用分块GeoTIFF")
+
+    # 验证波段数量
+    if src.count != EXPECTED_BAND_COUNT:
+        raise ValueError(f"期望{EXPECTED_BAND_COUNT}个波段，但文件包含{src.count}个波段")
+
+    # 读取顺序按指定波段排列（indexes为1基带号，读出即为目标排列，
+    # 无需整体读取后再按Python索引重排）
+    band_indexes = [RED_BAND_INDEX + 1, GREEN_BAND_INDEX + 1,
+                    BLUE_BAND_INDEX + 1, NIR_BAND_INDEX + 1]
+
+    # 输出地理变换：预览抽稀时按降采样比例缩放
+    transform = src.transform
+
+    # 预览抽稀：按2^N倍降采样整幅读取（GDAL优先走预计算金字塔）
+    bands_preview = None
+    if overview_level:
+        out_h = max(1, height >> overview_level)
+        out_w = max(1, width >> overview_level)
+        print(f"预览模式: 抽稀级别 {overview_level} → {out_w} x {out_h}")
+        bands_preview = src.read(
+            indexes=band_indexes,
+            out_shape=(EXPECTED_BAND_COUNT, out_h, out_w),
+            resampling=Resampling.average
+        )
+        transform = src.transform * src.transform.scale(
+            width / out_w, height / out_h
+        )
+        height, width = out_h, out_w
+
+    print(f"波段顺序: {band_order}")
+    print("\n正在提取数据...")
+
+    # 处理整个图像区域
+    start_i = 0
+    end_i = height
+    start_j = 0
+    end_j = width
+
+    if convert_rgb:
+        print(f"\n正在转换RGBN到0-255范围（标准遥感流程）...")
+        print(f"  裁剪范围: {clip_min}-{clip_max}")
+        print(f"  Gamma校正: γ={gamma}")
+        print(f"  255拉伸: {'启用' if stretch_255 else '禁用'}")
+
+    # 按GeoTIFF内部块窗口流式读取+转换：峰值内存只有输出立方体+单个窗口，
+    # 与影像整体尺寸无关；裁剪影像在同一遍历中逐窗写出，原始数据不整幅驻留
+    out_dtype = OUTPUT_DTYPE_RGB if convert_rgb else np.dtype(src.dtypes[0])
+    rgbn = np.empty((EXPECTED_BAND_COUNT, height, width), dtype=out_dtype)
+
+    # 保存原始影像（保持原始反射率值）：与读取共用同一窗口遍历
+    clipped_dst = None
+    if save_clipped_tiff:
+        # 生成输出文件名（在CSV同目录下）
+        output_dir = os.path.dirname(output_path)
+        csv_name = os.path.splitext(os.path.basename(output_path))[0]
+        clipped_tiff_path = os.path.join(output_dir, f"{csv_name}{CLIPPED_SUFFIX}")
+        print(f"\n正在保存原始影像: {clipped_tiff_path}")
+        clipped_dst = rasterio.open(
+            clipped_tiff_path,
+            'w',
+            driver='GTiff',
+            height=height,
+            width=width,
+            count=src.count,
+            dtype=src.dtypes[0],
+            crs=src.crs,
+            transform=transform,
+            compress=COMPRESSION_TYPE,
+            zstd_level=ZSTD_LEVEL,
+            predictor=PREDICTOR_INT,
+            tiled=True,
+            blockxsize=TILE_BLOCK_SIZE,
+            blockysize=TILE_BLOCK_SIZE,
+            num_threads=NUM_THREADS,
+            bigtiff=BIGTIFF_MODE
+        )
+
+    # 逐波段累计原始值范围（替代整幅归约，信息输出不变）
+    raw_min = np.full(EXPECTED_BAND_COUNT, np.inf)
+    raw_max = np.full(EXPECTED_BAND_COUNT, -np.inf)
+    window_count = 0
+
+    if bands_preview is not None:
+        # 预览模式：抽稀结果本身已很小，整幅处理无需窗口化
+        raw_min[:] = bands_preview.min(axis=(1, 2))
+        raw_max[:] = bands_preview.max(axis=(1, 2))
+        if clipped_dst is not None:
+            clipped_dst.write(bands_preview)
         if convert_rgb:
-            print(f"\n图像的原始数值范围:")
-            print(f"  红波段: {red_band_clipped.min():.1f} - {red_band_clipped.max():.1f}")
-            print(f"  绿波段: {green_band_clipped.min():.1f} - {green_band_clipped.max():.1f}")
-            print(f"  蓝波段: {blue_band_clipped.min():.1f} - {blue_band_clipped.max():.1f}")
-            print(f"  近红外: {nir_band_clipped.min():.1f} - {nir_band_clipped.max():.1f}")
-            
-            print(f"\n正在转换RGBN到0-255范围（标准遥感流程）...")
-            print(f"  裁剪范围: {clip_min}-{clip_max}")
-            print(f"  Gamma校正: γ={gamma}")
-            print(f"  255拉伸: {'启用' if stretch_255 else '禁用'}")
-            red_band = convert_to_rgb_255(red_band_clipped, clip_min, clip_max, gamma, stretch_255)
-            green_band = convert_to_rgb_255(green_band_clipped, clip_min, clip_max, gamma, stretch_255)
-            blue_band = convert_to_rgb_255(blue_band_clipped, clip_min, clip_max, gamma, stretch_255)
-            nir_band = convert_to_rgb_255(nir_band_clipped, clip_min, clip_max, gamma, stretch_255)
-            print(f"  转换后红波段范围: {red_band.min()} - {red_band.max()}")
-            print(f"  转换后绿波段范围: {green_band.min()} - {green_band.max()}")
-            print(f"  转换后蓝波段范围: {blue_band.min()} - {blue_band.max()}")
-            print(f"  转换后近红外波段范围: {nir_band.min()} - {nir_band.max()}")
+            rgbn[:] = convert_to_rgb_255(bands_preview, clip_min, clip_max,
+                                         gamma, stretch_255=False)
         else:
-            red_band = red_band_clipped
-            green_band = green_band_clipped
-            blue_band = blue_band_clipped
-            nir_band = nir_band_clipped
-        
-        print(f"处理区域: 行 {start_i}-{end_i}, 列 {start_j}-{end_j}")
-        print(f"实际处理尺寸: {end_i-start_i} x {end_j-start_j}")
-        
-        # 保存原始影像（保持原始反射率值）
-        if save_clipped_tiff:
-            # 使用整个图像的原始数据
-            clipped_data = bands_data
-            
-            # 使用原始的地理变换矩阵（无需重新计算）
-            clipped_transform = src.transform
-            
-            # 生成输出文件名（在CSV同目录下）
-            output_dir = os.path.dirname(output_path)
-            csv_name = os.path.splitext(os.path.basename(output_path))[0]
-            clipped_tiff_path = os.path.join(output_dir, f"{csv_name}{CLIPPED_SUFFIX}")
-            
-            print(f"\n正在保存原始影像: {clipped_tiff_path}")
-            
-            # 写入GeoTIFF文件
-            with rasterio.open(
-                clipped_tiff_path,
-                'w',
-                driver='GTiff',
-                height=clipped_data.shape[1],
-                width=clipped_data.shape[2],
-                count=src.count,
-                dtype=src.dtypes[0],
-                crs=src.crs,
-                transform=clipped_transform,
-                compress=COMPRESSION_TYPE
-            ) as dst:
-                dst.write(clipped_data)
-                # 复制波段描述
-                for i in range(1, src.count + 1):
-                    if src.descriptions[i-1]:
-                        dst.set_band_description(i, src.descriptions[i-1])
-            
-            print(f"✅ 原始影像已保存（尺寸: {clipped_data.shape[2]}x{clipped_data.shape[1]}, 数据类型: {src.dtypes[0]}）")
-        
-        # 保存转换后的RGB图像（如果启用了转换）
-        if save_clipped_tiff and convert_rgb:
-            # 创建转换后的RGB影像数组（4个波段：RGBN）
-            rgb_converted_data = np.zeros((EXPECTED_BAND_COUNT, end_i-start_i, end_j-start_j), dtype=OUTPUT_DTYPE_RGB)
-            rgb_converted_data[RED_BAND_INDEX] = red_band      # Red
-            rgb_converted_data[GREEN_BAND_INDEX] = green_band  # Green
-            rgb_converted_data[BLUE_BAND_INDEX] = blue_band    # Blue
-            rgb_converted_data[NIR_BAND_INDEX] = nir_band      # NIR
-            
-            # 生成转换后影像的文件名
-            rgb_tiff_path = os.path.join(output_dir, f"{csv_name}{RGB_CONVERTED_SUFFIX}")
-            
-            print(f"正在保存RGB转换后的影像: {rgb_tiff_path}")
-            
-            # 写入转换后的GeoTIFF文件
-            with rasterio.open(
-                rgb_tiff_path,
-                'w',
-                driver='GTiff',
-                height=rgb_converted_data.shape[1],
-                width=rgb_converted_data.shape[2],
-                count=EXPECTED_BAND_COUNT,
-                dtype=OUTPUT_DTYPE_RGB,
-                crs=src.crs,
-                transform=clipped_transform,
-                compress=COMPRESSION_TYPE
-            ) as dst:
-                dst.write(rgb_converted_data)
-                # 设置波段描述
-                dst.set_band_description(1, BAND_DESC_RED_RGB)
-                dst.set_band_description(2, BAND_DESC_GREEN_RGB)
-                dst.set_band_description(3, BAND_DESC_BLUE_RGB)
-                dst.set_band_description(4, BAND_DESC_NIR_RGB)
-            
-            print(f"✅ RGB转换影像已保存（尺寸: {rgb_converted_data.shape[2]}x{rgb_converted_data.shape[1]}, 数据类型: {OUTPUT_DTYPE_RGB.__name__}, 范围: 0-{RGB_MAX_VALUE}）")
-        
-        # 使用进度条处理数据
-        total_pixels = (end_i - start_i) * (end_j - start_j)
-        with tqdm(total=total_pixels, desc="处理像素") as pbar:
-            for i in range(end_i - start_i):
-                for j in range(end_j - start_j):
-                    # 检查是否有有效数据（非NaN值）
-                    if (not np.isnan(red_band[i, j]) and 
-                        not np.isnan(green_band[i, j]) and 
-                        not np.isnan(blue_band[i, j]) and 
-                        not np.isnan(nir_band[i, j])):
-                        
-                        # 将像素坐标转换为地理坐标（使用原始坐标）
-                        lon, lat = xy(src.transform, start_i + i, start_j + j)
-                        
-                        data_list.append({
-                            'longitude': lon,
-                            'latitude': lat, 
-                            'red': red_band[i, j],
-                            'green': green_band[i, j],
-                            'blue': blue_band[i, j],
-                            'nir': nir_band[i, j]
-                        })
-                    pbar.update(1)
-        
-        print(f"有效像素数量: {len(data_list)}")
-        
-        # 创建DataFrame
-        df = pd.DataFrame(data_list)
-        
-        # 保存为CSV
-        print(f"正在保存到: {output_path}")
-        df.to_csv(output_path, index=False)
-        
-        print("✅ 数据提取完成!")
-        print(f"CSV文件包含 {len(df)} 行数据")
-        print(f"列名: {list(df.columns)}")
-        
-        # 显示数据统计信息
-        print("\n数据统计:")
-        print(df.describe())
+            rgbn[:] = bands_preview
+        window_count = 1
+    else:
+        for _, window in src.block_windows(1):
+            tile = src.read(indexes=band_indexes, window=window)
+
+            for b in range(EXPECTED_BAND_COUNT):
+                raw_min[b] = min(raw_min[b], float(tile[b].min()))
+                raw_max[b] = max(raw_max[b], float(tile[b].max()))
+
+            if clipped_dst is not None:
+                clipped_dst.write(tile, window=window)
+
+            r0, c0 = int(window.row_off), int(window.col_off)
+            dest = rgbn[:, r0:r0 + int(window.height), c0:c0 + int(window.width)]
+            if convert_rgb:
+                # 窗口内完成裁剪+Gamma转换；255拉伸依赖全局范围，循环后统一查表
+                dest[:] = convert_to_rgb_255(tile, clip_min, clip_max, gamma,
+                                             stretch_255=False)
+            else:
+                dest[:] = tile
+            window_count += 1
+
+    if clipped_dst is not None:
+        # 复制波段描述
+        for i in range(1, src.count + 1):
+            if src.descriptions[i-1]:
+                clipped_dst.set_band_description(i, src.descriptions[i-1])
+        clipped_dst.close()
+        print(f"✅ 原始影像已保存（尺寸: {width}x{height}, 数据类型: {src.dtypes[0]}, {window_count}个窗口流式写出）")
+
+    print(f"\n图像的原始数值范围:")
+    print(f"  红波段: {raw_min[RED_BAND_INDEX]:.1f} - {raw_max[RED_BAND_INDEX]:.1f}")
+    print(f"  绿波段: {raw_min[GREEN_BAND_INDEX]:.1f} - {raw_max[GREEN_BAND_INDEX]:.1f}")
+    print(f"  蓝波段: {raw_min[BLUE_BAND_INDEX]:.1f} - {raw_max[BLUE_BAND_INDEX]:.1f}")
+    print(f"  近红外: {raw_min[NIR_BAND_INDEX]:.1f} - {raw_max[NIR_BAND_INDEX]:.1f}")
+
+    # 255拉伸：逐窗转换结束后基于全局min/max逐波段查表完成（结果与整幅转换一致）
+    if convert_rgb and stretch_255:
+        stretch_bands_255(rgbn)
+
+    red_band = rgbn[RED_BAND_INDEX]
+    green_band = rgbn[GREEN_BAND_INDEX]
+    blue_band = rgbn[BLUE_BAND_INDEX]
+    nir_band = rgbn[NIR_BAND_INDEX]
+
+    if convert_rgb:
+        print(f"  转换后红波段范围: {red_band.min()} - {red_band.max()}")
+        print(f"  转换后绿波段范围: {green_band.min()} - {green_band.max()}")
+        print(f"  转换后蓝波段范围: {blue_band.min()} - {blue_band.max()}")
+        print(f"  转换后近红外波段范围: {nir_band.min()} - {nir_band.max()}")
+
+    print(f"处理区域: 行 {start_i}-{end_i}, 列 {start_j}-{end_j}")
+    print(f"实际处理尺寸: {end_i-start_i} x {end_j-start_j}")
+
+    # 保存转换后的RGB图像（如果启用了转换）
+    if save_clipped_tiff and convert_rgb:
+        # 转换结果本身就是(4,H,W)的RGBN立方体，直接写出（免二次拼装拷贝）
+        # 生成转换后影像的文件名
+        rgb_tiff_path = os.path.join(output_dir, f"{csv_name}{RGB_CONVERTED_SUFFIX}")
+
+        print(f"正在保存RGB转换后的影像: {rgb_tiff_path}")
+
+        # 写入转换后的GeoTIFF文件
+        with rasterio.open(
+            rgb_tiff_path,
+            'w',
+            driver='GTiff',
+            height=height,
+            width=width,
+            count=EXPECTED_BAND_COUNT,
+            dtype=OUTPUT_DTYPE_RGB,
+            crs=src.crs,
+            transform=transform,
+            compress=COMPRESSION_TYPE,
+            zstd_level=ZSTD_LEVEL,
+            predictor=PREDICTOR_INT,
+            tiled=True,
+            blockxsize=TILE_BLOCK_SIZE,
+            blockysize=TILE_BLOCK_SIZE,
+            num_threads=NUM_THREADS,
+            bigtiff=BIGTIFF_MODE
+        ) as dst:
+            dst.write(rgbn)
+            # 设置波段描述
+            dst.set_band_description(1, BAND_DESC_RED_RGB)
+            dst.set_band_description(2, BAND_DESC_GREEN_RGB)
+            dst.set_band_description(3, BAND_DESC_BLUE_RGB)
+            dst.set_band_description(4, BAND_DESC_NIR_RGB)
+
+        print(f"✅ RGB转换影像已保存（尺寸: {width}x{height}, 数据类型: {OUTPUT_DTYPE_RGB.__name__}, 范围: 0-{RGB_MAX_VALUE}）")
+    
+    # 构建待输出像素的选择掩膜（有效数据 + 可选的外部掩膜）
+    select = np.ones((end_i - start_i, end_j - start_j), dtype=bool)
+
+    # 外部掩膜：只保留掩膜内的像素
+    if pixel_mask is not None:
+        if pixel_mask.shape != select.shape:
+            raise ValueError(
+                f"pixel_mask尺寸 {pixel_mask.shape} 与影像尺寸 {select.shape} 不匹配"
+            )
+        select &= pixel_mask.astype(bool)
+        print(f"已应用像素掩膜: 保留 {select.sum()} / {select.size} 个像素")
+
+    # 有效性检查：排除NaN像素（仅浮点波段可能出现NaN）
+    # 4个波段同属一个立方体、dtype一致：一次遍历累计出单个NaN掩膜，
+    # out=复用两块bool缓冲，替代4次独立的isnan+AND全量分配
+    if np.issubdtype(rgbn.dtype, np.floating):
+        nanmask = np.isnan(rgbn[0])
+        scratch = np.empty_like(nanmask)
+        for b in range(1, EXPECTED_BAND_COUNT):
+            np.isnan(rgbn[b], out=scratch)
+            np.logical_or(nanmask, scratch, out=nanmask)
+        np.logical_not(nanmask, out=nanmask)
+        select &= nanmask
+
+    # 只保留被选中的像素索引
+    sel_rows, sel_cols = np.nonzero(select)
+
+    # 向量化仿射变换：一次性计算所有选中像素的地理坐标（像元中心，等价于rasterio.transform.xy）
+    T = transform
+    cols_c = (start_j + sel_cols) + 0.5
+    rows_c = (start_i + sel_rows) + 0.5
+    lons = T.a * cols_c + T.b * rows_c + T.c
+    lats = T.d * cols_c + T.e * rows_c + T.f
 
-def extract_bands_to_csv_with_mask(input_path, mask_path, output_path, band_order=None, 
+    print(f"有效像素数量: {sel_rows.size}")
+
+    # 一次性组表：波段按选中索引花式取值，扁平列数组直接构造DataFrame
+    # （SoA列布局正是DataFrame的内部形态，无逐像素dict/Python循环，组表完全在C层完成）
+    df = pd.DataFrame({
+        'longitude': lons,
+        'latitude': lats,
+        'red': red_band[sel_rows, sel_cols],
+        'green': green_band[sel_rows, sel_cols],
+        'blue': blue_band[sel_rows, sel_cols],
+        'nir': nir_band[sel_rows, sel_cols]
+    })
+
+    # 降低波段列精度：0-255整数用uint8，原始整数反射率用uint16，浮点用float32
+    if DOWNCAST_OUTPUT:
+        for col in ('red', 'green', 'blue', 'nir'):
+            if np.issubdtype(df[col].dtype, np.integer):
+                df[col] = df[col].astype(
+                    np.uint8 if df[col].max() <= RGB_MAX_VALUE else np.uint16
+                )
+            else:
+                df[col] = df[col].astype(np.float32)
+
+
+    # 保存为CSV（附带Parquet伴随文件）
+    print(f"正在保存到: {output_path}")
+    save_table(df, output_path)
+    
+    print("✅ 数据提取完成!")
+    print(f"CSV文件包含 {len(df)} 行数据")
+    print(f"列名: {list(df.columns)}")
+    
+    # 显示数据统计信息
+    print("\n数据统计:")
+    print(df.describe())
+
+    return df
+
+def extract_bands_to_csv_with_mask(input_path, mask_path, output_path, band_order=None,
                                     convert_rgb=None, clip_min=None, clip_max=None, gamma=None,
-                                    save_clipped_tiff=None, stretch_255=None):
+                                    save_clipped_tiff=None, stretch_255=None, sparse_output=None):
     """
     从GeoTIFF文件提取RGB和近红外波段数据，并从掩膜文件读取water_mask
     
@@ -390,17 +734,19 @@ def extract_bands_to_csv_with_mask(input_path, mask_path, output_path, band_orde
     - gamma (float): Gamma校正系数，None时使用全局DEFAULT_GAMMA
     - save_clipped_tiff (bool): 是否保存处理后的原始影像，None时使用全局DEFAULT_SAVE_CLIPPED_TIFF
     - stretch_255 (bool): 是否在转换后再拉伸到完整0-255范围，None时使用全局DEFAULT_STRETCH_255
-    
+    - sparse_output (bool): 是否只输出water_mask=1的像素行（稀疏掩膜时大幅减少
+      输出行数与下游处理量），None时使用全局DEFAULT_SPARSE_OUTPUT
+
     方法:
-    ① 调用extract_bands_to_csv提取影像数据到CSV
-    ② 读取掩膜文件（支持PNG和TIF格式）
+    ① 读取掩膜文件（支持PNG和TIF格式）并转换为二值（>0视为水体）
+    ② 调用extract_bands_to_csv提取影像数据到CSV
+       （sparse_output启用时只遍历掩膜内的像素）
     ③ 验证掩膜尺寸与影像一致
-    ④ 将掩膜数据转换为二值（>0视为水体）
-    ⑤ 将掩膜数据追加到CSV的water_mask列
-    ⑥ 保存更新后的CSV文件
-    
+    ④ 将掩膜数据追加到CSV的water_mask列
+    ⑤ 保存更新后的CSV文件
+
     出参:
-    - 无（直接保存CSV文件，包含water_mask列）
+    - pd.DataFrame: 含water_mask列的提取结果（同时保存CSV文件）
     """
     # 使用全局默认值
     if band_order is None:
@@ -417,97 +763,101 @@ def extract_bands_to_csv_with_mask(input_path, mask_path, output_path, band_orde
         save_clipped_tiff = DEFAULT_SAVE_CLIPPED_TIFF
     if stretch_255 is None:
         stretch_255 = DEFAULT_STRETCH_255
-    
-    # ① 先调用原始函数提取影像数据
-    print(f"\n【步骤1/2】提取影像波段数据...")
-    extract_bands_to_csv(
-        input_path=input_path,
-        output_path=output_path,
-        band_order=band_order,
-        convert_rgb=convert_rgb,
-        clip_min=clip_min,
-        clip_max=clip_max,
-        gamma=gamma,
-        save_clipped_tiff=save_clipped_tiff,
-        stretch_255=stretch_255
-    )
-    
-    # ② 读取掩膜文件
-    print(f"\n【步骤2/2】读取掩膜文件并追加到CSV...")
+    if sparse_output is None:
+        sparse_output = DEFAULT_SPARSE_OUTPUT
+
+    # ① 先读取掩膜文件（sparse_output时提取阶段就需要掩膜）
+    print(f"\n【步骤1/2】读取掩膜文件...")
     print(f"掩膜文件: {mask_path}")
-    
+
     # 判断掩膜文件格式
     mask_ext = os.path.splitext(mask_path)[1].lower()
-    
+
     if mask_ext in ['.png', '.jpg', '.jpeg']:
-        # 使用PIL读取PNG等图像格式
-        mask_img = Image.open(mask_path)
-        mask_array = np.array(mask_img)
-        
-        # 如果是RGB图像，取第一个通道
-        if len(mask_array.shape) == 3:
-            mask_array = mask_array[:, :, 0]
-            
+        # 使用PIL读取PNG等图像格式：解码阶段直接转灰度单通道，
+        # 避免RGB掩膜先展开3通道数组再切片的3倍内存浪费
+        with Image.open(mask_path) as mask_img:
+            if mask_img.mode != 'L':
+                mask_img = mask_img.convert('L')
+            mask_array = np.asarray(mask_img)
+
     elif mask_ext in ['.tif', '.tiff']:
         # 使用rasterio读取GeoTIFF格式
         with rasterio.open(mask_path) as mask_src:
             mask_array = mask_src.read(1)  # 读取第一个波段
     else:
         raise ValueError(f"不支持的掩膜文件格式: {mask_ext}（支持: .png, .jpg, .tif）")
-    
+
     print(f"掩膜数据形状: {mask_array.shape}")
     print(f"掩膜值范围: {mask_array.min()} - {mask_array.max()}")
-    
-    # ③ 将掩膜转换为二值（>0视为水体=1，否则=0）
+
+    # 将掩膜转换为二值（>0视为水体=1，否则=0）
     mask_binary = (mask_array > 0).astype(np.uint8)
     water_pixels = (mask_binary == 1).sum()
     total_pixels = mask_binary.size
     water_percentage = water_pixels / total_pixels * 100
-    
+
     print(f"掩膜统计:")
     print(f"  水体像素: {water_pixels} ({water_percentage:.2f}%)")
     print(f"  非水体像素: {total_pixels - water_pixels} ({100-water_percentage:.2f}%)")
-    
-    # ④ 读取已生成的CSV文件
-    print(f"\n正在读取CSV文件: {output_path}")
-    df = pd.read_csv(output_path)
-    
-    print(f"CSV数据形状: {df.shape}")
-    print(f"CSV列名: {list(df.columns)}")
-    
-    # ⑤ 读取影像文件获取地理变换信息
+
+    if sparse_output:
+        print(f"稀疏输出模式: 只提取掩膜内的 {water_pixels} 个像素")
+
+    # ② 调用提取核心（直接复用返回的DataFrame，避免CSV往返）
+    # 影像只打开一次：提取与掩膜对齐共用同一数据集句柄，省去二次IFD解析
+    print(f"\n【步骤2/2】提取影像波段数据并追加掩膜列...")
+    print(f"正在读取文件: {input_path}")
     with rasterio.open(input_path) as src:
+        df = _extract_bands_from_dataset(
+            src, output_path,
+            band_order=band_order,
+            convert_rgb=convert_rgb,
+            clip_min=clip_min,
+            clip_max=clip_max,
+            gamma=gamma,
+            save_clipped_tiff=save_clipped_tiff,
+            stretch_255=stretch_255,
+            pixel_mask=mask_binary if sparse_output else None
+        )
+
+        # ③ 复用提取返回的DataFrame（无需重新读取CSV）
+        print(f"CSV数据形状: {df.shape}")
+        print(f"CSV列名: {list(df.columns)}")
+
+        # ④ 直接使用已打开数据集的地理变换信息
         # 验证掩膜尺寸
         if mask_binary.shape != (src.height, src.width):
             raise ValueError(
                 f"掩膜尺寸 {mask_binary.shape} 与影像尺寸 ({src.height}, {src.width}) 不匹配"
             )
         
-        # ⑥ 为CSV中的每个像素分配掩膜值
+        # ⑤ 为CSV中的每个像素分配掩膜值
+        # 向量化逆仿射变换一次性完成地理坐标→行列索引映射
+        # （向下取整等价于rasterio.transform.rowcol的默认行为）
         print(f"\n正在将掩膜数据追加到CSV...")
-        mask_values = []
-        
-        for idx, row in tqdm(df.iterrows(), total=len(df), desc="匹配掩膜值"):
-            lon = row['longitude']
-            lat = row['latitude']
-            
-            # 将地理坐标转换回像素坐标
-            py, px = rasterio.transform.rowcol(src.transform, lon, lat)
-            
-            # 获取对应的掩膜值
-            if 0 <= py < mask_binary.shape[0] and 0 <= px < mask_binary.shape[1]:
-                mask_value = mask_binary[py, px]
-            else:
-                mask_value = 0  # 超出范围默认为非水体
-            
-            mask_values.append(mask_value)
-        
-        # ⑦ 添加water_mask列到DataFrame
-        df[CSV_COL_WATER_MASK] = mask_values
+        inv_transform = ~src.transform
+        cols_f, rows_f = inv_transform * (df['longitude'].to_numpy(),
+                                          df['latitude'].to_numpy())
+        mask_rows = np.floor(rows_f).astype(np.int64)
+        mask_cols = np.floor(cols_f).astype(np.int64)
+
+        # 超出掩膜范围的像素默认为非水体
+        valid = ((mask_rows >= 0) & (mask_rows < mask_binary.shape[0]) &
+                 (mask_cols >= 0) & (mask_cols < mask_binary.shape[1]))
+        mask_values = np.where(
+            valid,
+            mask_binary[np.clip(mask_rows, 0, mask_binary.shape[0] - 1),
+                        np.clip(mask_cols, 0, mask_binary.shape[1] - 1)],
+            0
+        )
+
+        # ⑥ 添加water_mask列到DataFrame（uint8即可容纳0/1）
+        df[CSV_COL_WATER_MASK] = mask_values.astype(np.uint8)
         
-        # ⑧ 保存更新后的CSV
+        # ⑦ 保存更新后的CSV（附带Parquet伴随文件）
         print(f"\n正在保存更新后的CSV文件: {output_path}")
-        df.to_csv(output_path, index=False)
+        save_table(df, output_path)
         
         print(f"✅ 掩膜数据已追加!")
         print(f"新增列: {CSV_COL_WATER_MASK}")
@@ -520,6 +870,8 @@ def extract_bands_to_csv_with_mask(input_path, mask_path, output_path, band_orde
         print(f"  水体像素: {csv_water_pixels} ({csv_water_percentage:.2f}%)")
         print(f"  非水体像素: {len(df) - csv_water_pixels} ({100-csv_water_percentage:.2f}%)")
 
+    return df
+
 
 def main():
     """主函数"""
@@ -540,6 +892,8 @@ def main():
                        help='不保存处理后的原始GeoTIFF影像')
     parser.add_argument('--no-stretch-255', action='store_true',
                        help='不进行255范围拉伸（默认启用拉伸以增强对比度）')
+    parser.add_argument('--overview', type=int, default=None,
+                       help='预览抽稀级别N：按2^N倍降采样读取，用于快速QA预览（默认不抽稀）')
     
     args = parser.parse_args()
     
@@ -560,7 +914,8 @@ def main():
                             clip_max=args.clip_max,
                             gamma=args.gamma,
                             save_clipped_tiff=not args.no_save_tiff,
-                            stretch_255=not args.no_stretch_255)
+                            stretch_255=not args.no_stretch_255,
+                            overview_level=args.overview)
     except Exception as e:
         print(f"❌ 错误: {str(e)}")
 
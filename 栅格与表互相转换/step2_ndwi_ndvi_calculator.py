@@ -22,6 +22,13 @@ import pandas as pd
 import argparse
 import os
 
+# Numba为可选依赖：存在时使用并行融合核计算指数，否则回退到NumPy向量化
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 # ==================== 全局配置参数 ====================
 # CSV列名配置
 CSV_COL_LONGITUDE = 'longitude'        # 经度列名
@@ -57,10 +64,37 @@ STRETCH_MAX = 255                      # 拉伸后最大值
 GRAY_WEIGHT_RED = 0.299                # 红通道权重
 GRAY_WEIGHT_GREEN = 0.587              # 绿通道权重
 GRAY_WEIGHT_BLUE = 0.114               # 蓝通道权重
+GRAY_FIX_RED = 77                      # 红通道定点权重 round(0.299*256)
+GRAY_FIX_GREEN = 150                   # 绿通道定点权重 round(0.587*256)
+GRAY_FIX_BLUE = 29                     # 蓝通道定点权重 round(0.114*256)
+GRAY_FIX_SHIFT = 8                     # 定点位移量（权重按256缩放）
 
 # 输出配置
 OUTPUT_DECIMAL_PLACES = 6              # 输出小数位数
 
+# Parquet伴随文件配置（与step1保持一致）
+WRITE_PARQUET = True                   # 是否在CSV旁额外保存Parquet文件
+PARQUET_SUFFIX = '.parquet'            # Parquet文件后缀
+PARQUET_COMPRESSION = 'zstd'           # Parquet压缩算法
+
+# NumPy伴随文件配置（无压缩列存档，按列惰性读取，不依赖pyarrow）
+WRITE_NPZ = True                       # 是否在CSV旁额外保存.npz文件
+NPZ_SUFFIX = '.npz'                    # NumPy存档文件后缀
+
+# CSV读取配置：预声明各列dtype跳过类型推断，配合pyarrow引擎的SIMD解析
+# （字典中多余的列名会被pandas忽略，step1/step2两种CSV可共用）
+CSV_READ_DTYPES = {
+    'longitude': 'float64', 'latitude': 'float64',
+    'red': 'float32', 'green': 'float32', 'blue': 'float32', 'nir': 'float32',
+    'gray': 'float32', 'ndwi': 'float32', 'ndvi': 'float32',
+    'ndwi_255': 'float32', 'ndvi_255': 'float32',
+    'water_mask': 'uint8',
+}
+
+# 列保留配置
+KEEP_FLOAT_INDICES = True              # 是否保留float型ndwi/ndvi列
+                                       # （False时只输出uint8拉伸列，省8N字节/行）
+
 # 统计配置
 DISPLAY_STATS = True                   # 是否显示统计信息
 DISPLAY_HISTOGRAM_BINS = 10            # 直方图分组数量
@@ -76,6 +110,100 @@ DISPLAY_HISTOGRAM_BINS = 10            # 直方图分组数量
 # ====================================================
 
 
+def load_table(input_csv, columns=None):
+    """
+    读取数据表，优先使用CSV旁的Parquet伴随文件
+
+    入参:
+    - input_csv (str): 输入CSV文件路径
+    - columns (list): 需要的列名，None时读取全部列（Parquet/npz支持列裁剪）
+
+    方法:
+    ① 优先读取同名.npz伴随文件（无压缩列存档，只取用到的列成员）
+    ② 其次读取同名.parquet文件（跳过文本解析）
+    ③ 否则回退到pd.read_csv（pyarrow引擎+预声明dtype，无pyarrow时用默认引擎）
+    伴随文件比CSV旧时视为过期，不使用
+
+    出参:
+    - pd.DataFrame: 读取的数据表
+    """
+    npz_path = os.path.splitext(input_csv)[0] + NPZ_SUFFIX
+
+    if os.path.exists(npz_path):
+        csv_missing_or_older = (not os.path.exists(input_csv) or
+                                os.path.getmtime(npz_path) >= os.path.getmtime(input_csv))
+        if csv_missing_or_older:
+            print(f"检测到NumPy伴随文件，优先读取: {npz_path}")
+            with np.load(npz_path) as npz:
+                names = columns if columns is not None else list(npz.files)
+                return pd.DataFrame({name: npz[name] for name in names})
+
+    parquet_path = os.path.splitext(input_csv)[0] + PARQUET_SUFFIX
+
+    if os.path.exists(parquet_path):
+        csv_missing_or_older = (not os.path.exists(input_csv) or
+                                os.path.getmtime(parquet_path) >= os.path.getmtime(input_csv))
+        if csv_missing_or_older:
+            print(f"检测到Parquet伴随文件，优先读取: {parquet_path}")
+            try:
+                return pd.read_parquet(parquet_path, columns=columns)
+            except ImportError:
+                print(f"⚠️  未安装pyarrow，回退到CSV读取")
+
+    try:
+        return pd.read_csv(input_csv, engine='pyarrow', dtype=CSV_READ_DTYPES)
+    except ImportError:
+        return pd.read_csv(input_csv, dtype=CSV_READ_DTYPES)
+
+
+def save_table(df, output_csv, columns=None):
+    """
+    保存数据表为CSV，并可选地在旁边保存Parquet伴随文件
+
+    入参:
+    - df (pd.DataFrame): 待保存的数据表
+    - output_csv (str): 输出CSV文件路径
+    - columns (list): CSV列输出顺序，None时按df自身列顺序
+      （写出时选列，调用方无需df[column_order]整表重排拷贝）
+
+    方法:
+    ① 按OUTPUT_DECIMAL_PLACES保存CSV文件：优先用pyarrow的多线程C++写出
+       （to_csv对每个浮点值做Python级格式化，宽数值表上慢5-10倍）；
+       pyarrow不支持float_format，先对浮点列round到相同小数位保持精度一致
+    ② 若启用WRITE_PARQUET，在同目录保存同名.parquet文件（保留完整精度，
+       列序按df自身顺序，下游按列名读取）
+    ③ 若启用WRITE_NPZ，在同目录保存同名.npz文件（每列一个数组成员，
+       step3/step4只按需读取用到的列）
+
+    出参:
+    - 无（直接保存文件）
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+        float_cols = [col for col in df.columns if df[col].dtype.kind == 'f']
+        rounded = df.copy(deep=False)
+        rounded[float_cols] = df[float_cols].round(OUTPUT_DECIMAL_PLACES)
+        tbl = pa.Table.from_pandas(rounded, preserve_index=False, columns=columns)
+        pa_csv.write_csv(tbl, output_csv)
+    except ImportError:
+        df.to_csv(output_csv, index=False, columns=columns,
+                  float_format=f'%.{OUTPUT_DECIMAL_PLACES}f')
+
+    if WRITE_PARQUET:
+        parquet_path = os.path.splitext(output_csv)[0] + PARQUET_SUFFIX
+        try:
+            df.to_parquet(parquet_path, engine='pyarrow', compression=PARQUET_COMPRESSION)
+            print(f"✓ Parquet伴随文件已保存: {parquet_path}")
+        except ImportError:
+            print(f"⚠️  未安装pyarrow，跳过Parquet伴随文件")
+
+    if WRITE_NPZ:
+        npz_path = os.path.splitext(output_csv)[0] + NPZ_SUFFIX
+        np.savez(npz_path, **{col: df[col].to_numpy() for col in df.columns})
+        print(f"✓ NumPy伴随文件已保存: {npz_path}")
+
+
 def calculate_ndwi(green, nir, epsilon=None):
     """
     计算NDWI (归一化差异水体指数) - McFeeters 1996
@@ -140,6 +268,201 @@ def calculate_ndvi(red, nir, epsilon=None):
     return ndvi
 
 
+if NUMBA_AVAILABLE:
+    # 显式签名：装饰时即编译（而非首次调用时），配合cache=True把编译产物
+    # 落盘到__pycache__，后续进程import后直接加载，免去每次运行的JIT延迟。
+    # 输入数组声明为readonly：pandas的to_numpy(copy=False)常返回只读视图，
+    # 可写数组可以安全转入只读形参，反之则不行
+    from numba import types as nb_types
+    _F4_RO = nb_types.Array(nb_types.float32, 1, 'C', readonly=True)
+    _U1_RO = nb_types.Array(nb_types.uint8, 1, 'C', readonly=True)
+    _F8_RO = nb_types.Array(nb_types.float64, 1, 'C', readonly=True)
+    _F4_OUT = nb_types.float32[::1]
+    _U1_OUT = nb_types.uint8[::1]
+    INDICES_KERNEL_SIG = nb_types.void(
+        _F4_RO, _F4_RO, _F4_RO, _F4_RO,
+        _U1_OUT, _F4_OUT, _F4_OUT, _U1_OUT, _U1_OUT)
+    REDUCE_STATS_SIG = [nb_types.UniTuple(nb_types.float64, 4)(_F4_RO),
+                        nb_types.UniTuple(nb_types.float64, 4)(_U1_RO),
+                        nb_types.UniTuple(nb_types.float64, 4)(_F8_RO)]
+
+    # 不开fastmath：uint8量化经由截断，乘除重排会在整数边界产生±1偏差
+    @njit(INDICES_KERNEL_SIG, parallel=True, cache=True)
+    def indices_kernel(red, green, blue, nir,
+                       out_gray, out_ndwi, out_ndvi, out_ndwi_255, out_ndvi_255):
+        """
+        灰度+NDWI/NDVI+255拉伸融合计算核（Numba并行）
+
+        入参:
+        - red/green/blue/nir (np.ndarray): 连续float32波段数组
+        - out_gray/out_ndwi_255/out_ndvi_255 (np.ndarray): 预分配的uint8输出数组
+        - out_ndwi/out_ndvi (np.ndarray): 预分配的float32输出数组
+
+        方法:
+        - 单次遍历完成全部派生列：每像素读4个值、写5个值
+        - 与分链的NumPy表达式相比省去全部中间float数组与重复扫描
+          （灰度、两个指数、两个拉伸原本各自遍历一遍波段）
+
+        出参:
+        - 无（结果写入5个out数组）
+        """
+        # 常量预转float32：避免Python float常量把逐像素运算提升为float64，
+        # 保证与NumPy回退路径（全程float32）的量化结果一致
+        f_r = np.int32(GRAY_FIX_RED)
+        f_g = np.int32(GRAY_FIX_GREEN)
+        f_b = np.int32(GRAY_FIX_BLUE)
+        f_half = np.int32(1 << (GRAY_FIX_SHIFT - 1))
+        f_shift = np.int32(GRAY_FIX_SHIFT)
+        eps = np.float32(EPSILON)
+        idx_min = np.float32(NDWI_MIN)
+        idx_range = np.float32(NDWI_MAX - NDWI_MIN)
+        s_max = np.float32(STRETCH_MAX)
+        lo = np.float32(0.0)
+        hi = np.float32(255.0)
+
+        for i in prange(red.size):
+            r = red[i]
+            g = green[i]
+            b = blue[i]
+            n = nir[i]
+
+            # BT.601定点灰度：整数乘加+位移，与rgb_to_gray的定点路径逐位一致
+            gray = (f_r * np.int32(r) + f_g * np.int32(g)
+                    + f_b * np.int32(b) + f_half) >> f_shift
+            out_gray[i] = np.uint8(min(max(gray, np.int32(0)), np.int32(255)))
+
+            ndwi = (g - n) / (g + n + eps)
+            ndvi = (n - r) / (n + r + eps)
+            ndwi = min(max(ndwi, np.float32(NDWI_MIN)), np.float32(NDWI_MAX))
+            ndvi = min(max(ndvi, np.float32(NDVI_MIN)), np.float32(NDVI_MAX))
+            out_ndwi[i] = ndwi
+            out_ndvi[i] = ndvi
+
+            ndwi_s = (ndwi - idx_min) / idx_range * s_max
+            ndvi_s = (ndvi - idx_min) / idx_range * s_max
+            out_ndwi_255[i] = np.uint8(min(max(ndwi_s, lo), hi))
+            out_ndvi_255[i] = np.uint8(min(max(ndvi_s, lo), hi))
+
+    @njit(REDUCE_STATS_SIG, parallel=True, cache=True)
+    def reduce_stats_kernel(values):
+        """
+        单次遍历归约核：min/max/sum/sumsq（Numba并行）
+
+        入参:
+        - values (np.ndarray): 一维数值数组
+
+        方法:
+        - 按固定块数切分，各块并行累积局部min/max/sum/sumsq后合并
+        - float64累加：sumsq推导方差对精度敏感，float32累加会损失有效位
+
+        出参:
+        - tuple (vmin, vmax, total, sumsq): 4个float64标量
+        """
+        nblocks = 64
+        block = (values.size + nblocks - 1) // nblocks
+        mins = np.full(nblocks, np.inf, dtype=np.float64)
+        maxs = np.full(nblocks, -np.inf, dtype=np.float64)
+        sums = np.zeros(nblocks, dtype=np.float64)
+        sumsqs = np.zeros(nblocks, dtype=np.float64)
+        for b in prange(nblocks):
+            start = b * block
+            end = min(start + block, values.size)
+            vmin = np.inf
+            vmax = -np.inf
+            total = 0.0
+            sumsq = 0.0
+            for i in range(start, end):
+                v = np.float64(values[i])
+                if v < vmin:
+                    vmin = v
+                if v > vmax:
+                    vmax = v
+                total += v
+                sumsq += v * v
+            mins[b] = vmin
+            maxs[b] = vmax
+            sums[b] = total
+            sumsqs[b] = sumsq
+        return mins.min(), maxs.max(), sums.sum(), sumsqs.sum()
+
+
+def column_stats(values):
+    """
+    单次遍历计算一列的min/max/mean/median/std统计量
+
+    入参:
+    - values (np.ndarray): 一维数值数组
+
+    方法:
+    ① Numba可用时调用并行归约核，一次扫描得到min/max/sum/sumsq
+    ② 否则用NumPy归约（min/max/sum/dot各扫一遍）
+    ③ 由sum/sumsq推导均值与样本标准差（ddof=1，与pandas一致）
+    ④ 中位数需要选择算法，单独用np.median计算
+
+    出参:
+    - dict: {'min','max','mean','median','std'} 5个float统计量
+    """
+    values = np.ascontiguousarray(values)
+    n = values.size
+
+    if NUMBA_AVAILABLE:
+        # 归约核按显式签名预编译，签名之外的dtype统一提升为float64
+        if values.dtype not in (np.float32, np.uint8, np.float64):
+            values = values.astype(np.float64)
+        vmin, vmax, total, sumsq = reduce_stats_kernel(values)
+    else:
+        values64 = values.astype(np.float64, copy=False)
+        vmin = float(values64.min())
+        vmax = float(values64.max())
+        total = float(values64.sum())
+        sumsq = float(np.dot(values64, values64))
+
+    mean = total / n
+    # 样本方差 = (sumsq - n*mean²) / (n-1)，数值下限截到0防止舍入出负
+    var = max(sumsq - n * mean * mean, 0.0) / (n - 1) if n > 1 else 0.0
+    return {'min': float(vmin), 'max': float(vmax), 'mean': mean,
+            'median': float(np.median(values)), 'std': float(np.sqrt(var))}
+
+
+def compute_all_indices(red, green, blue, nir):
+    """
+    一次遍历计算全部派生列：灰度、NDWI、NDVI及其0-255拉伸
+
+    入参:
+    - red (np.ndarray): 红波段值（0-255）
+    - green (np.ndarray): 绿波段值（0-255）
+    - blue (np.ndarray): 蓝波段值（0-255）
+    - nir (np.ndarray): 近红外波段值（0-255）
+
+    方法:
+    ① 将波段转为连续float32数组（SoA布局）
+    ② Numba可用时调用并行融合核，单次遍历写出全部5列
+    ③ Numba不可用时回退到rgb_to_gray/calculate_ndwi/calculate_ndvi/
+       stretch_to_255的向量化实现
+
+    出参:
+    - tuple: (gray, ndwi, ndvi, ndwi_255, ndvi_255) 共5个数组
+    """
+    red = np.ascontiguousarray(red, dtype=np.float32)
+    green = np.ascontiguousarray(green, dtype=np.float32)
+    blue = np.ascontiguousarray(blue, dtype=np.float32)
+    nir = np.ascontiguousarray(nir, dtype=np.float32)
+
+    if NUMBA_AVAILABLE:
+        gray = np.empty(red.size, dtype=np.uint8)
+        ndwi = np.empty(red.size, dtype=np.float32)
+        ndvi = np.empty(red.size, dtype=np.float32)
+        ndwi_255 = np.empty(red.size, dtype=np.uint8)
+        ndvi_255 = np.empty(red.size, dtype=np.uint8)
+        indices_kernel(red, green, blue, nir, gray, ndwi, ndvi, ndwi_255, ndvi_255)
+        return gray, ndwi, ndvi, ndwi_255, ndvi_255
+
+    gray = rgb_to_gray(red, green, blue)
+    ndwi = calculate_ndwi(green, nir)
+    ndvi = calculate_ndvi(red, nir)
+    return gray, ndwi, ndvi, stretch_to_255(ndwi), stretch_to_255(ndvi)
+
+
 def stretch_to_255(index_value, min_val=None, max_val=None):
     """
     将归一化指数（-1到1）拉伸到0-255范围
@@ -163,17 +486,17 @@ def stretch_to_255(index_value, min_val=None, max_val=None):
         min_val = -1.0
     if max_val is None:
         max_val = 1.0
-    
-    # ① 线性拉伸到0-255范围
-    stretched = (index_value - min_val) / (max_val - min_val) * STRETCH_MAX
-    
-    # ② 裁剪到合理范围
-    stretched = np.clip(stretched, STRETCH_MIN, STRETCH_MAX)
-    
+
+    # ①② 线性拉伸+裁剪：全程out=复用一块float32缓冲
+    # （分步表达式的减法/除法/乘法/裁剪各分配一个全尺寸临时数组，这里只保留一块）
+    stretched = np.asarray(index_value).astype(np.float32, copy=True)
+    np.subtract(stretched, np.float32(min_val), out=stretched)
+    np.divide(stretched, np.float32(max_val - min_val), out=stretched)
+    np.multiply(stretched, np.float32(STRETCH_MAX), out=stretched)
+    np.clip(stretched, STRETCH_MIN, STRETCH_MAX, out=stretched)
+
     # ③ 转换为整数
-    stretched = stretched.astype(np.uint8)
-    
-    return stretched
+    return stretched.astype(np.uint8)
 
 
 def rgb_to_gray(red, green, blue, weight_r=None, weight_g=None, weight_b=None):
@@ -192,11 +515,22 @@ def rgb_to_gray(red, green, blue, weight_r=None, weight_g=None, weight_b=None):
     ① 使用ITU-R BT.601标准灰度转换公式
     ② Gray = 0.299*R + 0.587*G + 0.114*B
     ③ 该公式考虑了人眼对不同颜色的敏感度
-    ④ 裁剪到0-255范围并转为uint8
-    
+    ④ 默认权重时走整数定点路径：(77*R + 150*G + 29*B + 128) >> 8，
+       纯整数乘加+位移，无float转换、便于SIMD向量化
+    ⑤ 自定义权重时保留浮点路径，裁剪到0-255范围并转为uint8
+
     出参:
     - int/array: 灰度值，范围 0 到 255
     """
+    # 默认BT.601权重：定点整数路径（权重按256缩放，+128实现四舍五入）
+    if weight_r is None and weight_g is None and weight_b is None:
+        gray = GRAY_FIX_RED * np.asarray(red).astype(np.uint16)
+        gray += GRAY_FIX_GREEN * np.asarray(green).astype(np.uint16)
+        gray += GRAY_FIX_BLUE * np.asarray(blue).astype(np.uint16)
+        gray += 1 << (GRAY_FIX_SHIFT - 1)
+        gray >>= GRAY_FIX_SHIFT
+        return gray.astype(np.uint8)
+
     # 使用全局默认值
     if weight_r is None:
         weight_r = GRAY_WEIGHT_RED
@@ -204,16 +538,16 @@ def rgb_to_gray(red, green, blue, weight_r=None, weight_g=None, weight_b=None):
         weight_g = GRAY_WEIGHT_GREEN
     if weight_b is None:
         weight_b = GRAY_WEIGHT_BLUE
-    
+
     # ① 加权平均计算灰度值
     gray = weight_r * red + weight_g * green + weight_b * blue
-    
+
     # ② 裁剪到0-255范围
     gray = np.clip(gray, 0, 255)
-    
+
     # ③ 转换为uint8整数
     gray = gray.astype(np.uint8)
-    
+
     return gray
 
 
@@ -222,17 +556,22 @@ def rgb_to_gray(red, green, blue, weight_r=None, weight_g=None, weight_b=None):
 # 不再通过NDWI/NDVI阈值计算
 
 
-def compute_indices(input_csv, output_csv, display_stats=None):
+def compute_indices(input_csv, output_csv, display_stats=None, input_df=None,
+                    keep_float_indices=None):
     """
     从CSV文件读取波段数据并计算NDWI和NDVI
-    
+
     入参:
-    - input_csv (str): 输入CSV文件路径
+    - input_csv (str): 输入CSV文件路径（input_df非None时可为None）
     - output_csv (str): 输出CSV文件路径
     - display_stats (bool): 是否显示统计信息，None时使用全局DISPLAY_STATS
-    
+    - input_df (pd.DataFrame): 直接传入的step1数据，非None时跳过CSV读取
+    - keep_float_indices (bool): 是否保留float型ndwi/ndvi列，
+      None时使用全局KEEP_FLOAT_INDICES；False时仅输出uint8拉伸列，
+      每行省8字节（统计信息仍基于float值计算）
+
     方法:
-    ① 读取CSV文件并验证必需的列（包括water_mask）
+    ① 读取CSV文件（或直接使用input_df）并验证必需的列（包括water_mask）
     ② 提取红、绿、蓝、近红外波段数据
     ③ 计算灰度通道（RGB合并）
     ④ 使用向量化操作批量计算NDWI和NDVI
@@ -241,19 +580,24 @@ def compute_indices(input_csv, output_csv, display_stats=None):
     ⑦ 调整列顺序（将water_mask移到最后）
     ⑧ 保存为新的CSV文件
     ⑨ 输出统计信息和数据分布
-    
+
     出参:
-    - 无（直接保存CSV文件）
+    - pd.DataFrame: 含指数的结果数据（同时保存CSV文件）
     """
     # 使用全局默认值
     if display_stats is None:
         display_stats = DISPLAY_STATS
-    
-    print(f"正在读取CSV文件: {input_csv}")
-    
-    # ① 读取CSV文件
-    df = pd.read_csv(input_csv)
-    
+    if keep_float_indices is None:
+        keep_float_indices = KEEP_FLOAT_INDICES
+
+    # ① 读取CSV文件（若上游直接传入DataFrame则跳过磁盘读取）
+    if input_df is not None:
+        print(f"使用上游传入的DataFrame（跳过CSV读取）")
+        df = input_df.copy()
+    else:
+        print(f"正在读取CSV文件: {input_csv}")
+        df = load_table(input_csv)
+
     print(f"CSV数据形状: {df.shape}")
     print(f"列名: {list(df.columns)}")
     
@@ -269,30 +613,27 @@ def compute_indices(input_csv, output_csv, display_stats=None):
     print(f"\n原始数据统计:")
     print(df[required_cols].describe())
     
-    # ③ 提取波段数据（转换为numpy数组进行向量化计算）
-    red = df[CSV_COL_RED].values
-    green = df[CSV_COL_GREEN].values
-    blue = df[CSV_COL_BLUE].values
-    nir = df[CSV_COL_NIR].values
-    
-    # ④ 计算灰度通道（RGB合并为单通道）
-    print(f"\n正在计算灰度通道...")
-    df[CSV_COL_GRAY] = rgb_to_gray(red, green, blue)
+    # ③ 提取波段数据（在入口处统一转float32：0-255值域下float64精度无收益，
+    # 带宽减半且SIMD通道翻倍；列本身已是float32时copy=False零拷贝）
+    red = df[CSV_COL_RED].to_numpy(dtype=np.float32, copy=False)
+    green = df[CSV_COL_GREEN].to_numpy(dtype=np.float32, copy=False)
+    blue = df[CSV_COL_BLUE].to_numpy(dtype=np.float32, copy=False)
+    nir = df[CSV_COL_NIR].to_numpy(dtype=np.float32, copy=False)
+    
+    # ④⑤⑥ 单次遍历融合计算全部派生列：灰度、NDWI、NDVI及其0-255拉伸
+    # （每像素读4个波段值、写5个结果值，无中间数组）
+    print(f"\n正在计算灰度通道、NDWI、NDVI及0-255拉伸（融合单遍）...")
+    gray, ndwi, ndvi, ndwi_255, ndvi_255 = compute_all_indices(red, green, blue, nir)
+    df[CSV_COL_GRAY] = gray
+    if keep_float_indices:
+        df[CSV_COL_NDWI] = ndwi
+        df[CSV_COL_NDVI] = ndvi
+    df[CSV_COL_NDWI_255] = ndwi_255
+    df[CSV_COL_NDVI_255] = ndvi_255
+
     print(f"✓ 灰度通道计算完成 (范围: {df[CSV_COL_GRAY].min()}-{df[CSV_COL_GRAY].max()})")
-    
-    # ⑤ 批量计算NDWI和NDVI（向量化操作，高效）
-    print(f"\n正在计算NDWI和NDVI...")
-    df[CSV_COL_NDWI] = calculate_ndwi(green, nir)
-    df[CSV_COL_NDVI] = calculate_ndvi(red, nir)
-    
     print(f"✓ NDWI计算完成")
     print(f"✓ NDVI计算完成")
-    
-    # ⑥ 将NDWI和NDVI拉伸到0-255范围（便于可视化和保存为图像）
-    print(f"\n正在将指数拉伸到0-255范围...")
-    df[CSV_COL_NDWI_255] = stretch_to_255(df[CSV_COL_NDWI].values)
-    df[CSV_COL_NDVI_255] = stretch_to_255(df[CSV_COL_NDVI].values)
-    
     print(f"✓ NDWI拉伸完成 (范围: {df[CSV_COL_NDWI_255].min()}-{df[CSV_COL_NDWI_255].max()})")
     print(f"✓ NDVI拉伸完成 (范围: {df[CSV_COL_NDVI_255].min()}-{df[CSV_COL_NDVI_255].max()})")
     
@@ -308,41 +649,53 @@ def compute_indices(input_csv, output_csv, display_stats=None):
     print(f"  水体像素数量: {water_pixels} ({water_percentage:.2f}%)")
     print(f"  非水体像素数量: {len(df) - water_pixels} ({100-water_percentage:.2f}%)")
     
-    # ⑧ 调整列顺序：将water_mask移到最后
-    print(f"\n正在调整列顺序（water_mask移到最后）...")
-    column_order = ['longitude', 'latitude', 'red', 'green', 'blue', 'nir', 
+    # ⑧ 确定CSV列顺序：water_mask移到最后（仅在写出时选列，
+    # 不做df[column_order]整表重排拷贝；下游按列名取列，不依赖列序）
+    column_order = ['longitude', 'latitude', 'red', 'green', 'blue', 'nir',
                     'gray', 'ndwi', 'ndvi', 'ndwi_255', 'ndvi_255', 'water_mask']
-    df = df[column_order]
-    print(f"✓ 列顺序已调整: {list(df.columns)}")
-    
-    # ⑨ 保存到新CSV文件
+    if not keep_float_indices:
+        column_order = [col for col in column_order
+                        if col not in (CSV_COL_NDWI, CSV_COL_NDVI)]
+        print(f"\n已丢弃float型ndwi/ndvi列（仅保留uint8拉伸列）")
+    print(f"\nCSV输出列顺序（water_mask最后）: {column_order}")
+
+    # ⑨ 保存到新CSV文件（附带Parquet伴随文件）
     print(f"\n正在保存到: {output_csv}")
-    df.to_csv(output_csv, index=False, float_format=f'%.{OUTPUT_DECIMAL_PLACES}f')
-    
+    save_table(df, output_csv, columns=column_order)
+
     print(f"✅ 计算完成!")
     print(f"输出文件: {output_csv}")
     print(f"数据行数: {len(df)}")
-    print(f"输出列: {list(df.columns)}")
+    print(f"输出列: {column_order}")
     
     # ⑩ 显示统计信息
     if display_stats:
         print(f"\n" + "="*60)
         print("NDWI和NDVI统计信息")
         print("="*60)
-        
+
+        # 所有归约一次计算：每列单次遍历得到min/max/mean/std（Numba并行归约核，
+        # 中位数另算），替代约20次独立的全量遍历。
+        # 直接使用融合核输出的本地数组，不经df取列
+        # （keep_float_indices=False时df中已无float指数列）
+        stats_sources = {CSV_COL_NDWI: ndwi, CSV_COL_NDVI: ndvi,
+                         CSV_COL_GRAY: gray,
+                         CSV_COL_NDWI_255: ndwi_255, CSV_COL_NDVI_255: ndvi_255}
+        stats = {col: column_stats(arr) for col, arr in stats_sources.items()}
+
         # NDWI统计
         print(f"\n【NDWI - 归一化差异水体指数】")
         print(f"  公式: (Green - NIR) / (Green + NIR)")
         print(f"  范围: -1 (非水体) 到 +1 (纯水体)")
-        print(f"  最小值: {df[CSV_COL_NDWI].min():.6f}")
-        print(f"  最大值: {df[CSV_COL_NDWI].max():.6f}")
-        print(f"  平均值: {df[CSV_COL_NDWI].mean():.6f}")
-        print(f"  中位数: {df[CSV_COL_NDWI].median():.6f}")
-        print(f"  标准差: {df[CSV_COL_NDWI].std():.6f}")
+        print(f"  最小值: {stats[CSV_COL_NDWI]['min']:.6f}")
+        print(f"  最大值: {stats[CSV_COL_NDWI]['max']:.6f}")
+        print(f"  平均值: {stats[CSV_COL_NDWI]['mean']:.6f}")
+        print(f"  中位数: {stats[CSV_COL_NDWI]['median']:.6f}")
+        print(f"  标准差: {stats[CSV_COL_NDWI]['std']:.6f}")
         
-        # NDWI分布统计
-        ndwi_positive = (df[CSV_COL_NDWI] > 0).sum()
-        ndwi_negative = (df[CSV_COL_NDWI] <= 0).sum()
+        # NDWI分布统计：count_nonzero直接计数，不生成布尔Series再求和
+        ndwi_positive = int(np.count_nonzero(ndwi > 0))
+        ndwi_negative = len(df) - ndwi_positive
         print(f"\n  分布统计:")
         print(f"    正值像素 (可能为水体): {ndwi_positive} ({ndwi_positive/len(df)*100:.2f}%)")
         print(f"    负值像素 (可能为非水体): {ndwi_negative} ({ndwi_negative/len(df)*100:.2f}%)")
@@ -351,18 +704,18 @@ def compute_indices(input_csv, output_csv, display_stats=None):
         print(f"\n【NDVI - 归一化差异植被指数】")
         print(f"  公式: (NIR - Red) / (NIR + Red)")
         print(f"  范围: -1 (无植被) 到 +1 (茂密植被)")
-        print(f"  最小值: {df[CSV_COL_NDVI].min():.6f}")
-        print(f"  最大值: {df[CSV_COL_NDVI].max():.6f}")
-        print(f"  平均值: {df[CSV_COL_NDVI].mean():.6f}")
-        print(f"  中位数: {df[CSV_COL_NDVI].median():.6f}")
-        print(f"  标准差: {df[CSV_COL_NDVI].std():.6f}")
+        print(f"  最小值: {stats[CSV_COL_NDVI]['min']:.6f}")
+        print(f"  最大值: {stats[CSV_COL_NDVI]['max']:.6f}")
+        print(f"  平均值: {stats[CSV_COL_NDVI]['mean']:.6f}")
+        print(f"  中位数: {stats[CSV_COL_NDVI]['median']:.6f}")
+        print(f"  标准差: {stats[CSV_COL_NDVI]['std']:.6f}")
         
-        # NDVI分类统计
-        ndvi_water = (df[CSV_COL_NDVI] < 0).sum()
-        ndvi_bare = ((df[CSV_COL_NDVI] >= 0) & (df[CSV_COL_NDVI] < 0.2)).sum()
-        ndvi_sparse = ((df[CSV_COL_NDVI] >= 0.2) & (df[CSV_COL_NDVI] < 0.4)).sum()
-        ndvi_moderate = ((df[CSV_COL_NDVI] >= 0.4) & (df[CSV_COL_NDVI] < 0.6)).sum()
-        ndvi_dense = (df[CSV_COL_NDVI] >= 0.6).sum()
+        # NDVI分类统计：np.histogram单次遍历完成5个区间的分箱计数，
+        # 替代5组布尔掩膜（共8次全量比较）
+        ndvi_bins = [-np.inf, 0.0, 0.2, 0.4, 0.6, np.inf]
+        ndvi_counts, _ = np.histogram(ndvi, bins=ndvi_bins)
+        ndvi_water, ndvi_bare, ndvi_sparse, ndvi_moderate, ndvi_dense = (
+            int(c) for c in ndvi_counts)
         
         print(f"\n  分类统计:")
         print(f"    水体/裸土 (NDVI < 0): {ndvi_water} ({ndvi_water/len(df)*100:.2f}%)")
@@ -374,10 +727,10 @@ def compute_indices(input_csv, output_csv, display_stats=None):
         # 灰度通道统计
         print(f"\n【灰度通道 - RGB合并】")
         print(f"  公式: Gray = 0.299*R + 0.587*G + 0.114*B")
-        print(f"  最小值: {df[CSV_COL_GRAY].min()}")
-        print(f"  最大值: {df[CSV_COL_GRAY].max()}")
-        print(f"  平均值: {df[CSV_COL_GRAY].mean():.2f}")
-        print(f"  中位数: {df[CSV_COL_GRAY].median():.2f}")
+        print(f"  最小值: {stats[CSV_COL_GRAY]['min']:.0f}")
+        print(f"  最大值: {stats[CSV_COL_GRAY]['max']:.0f}")
+        print(f"  平均值: {stats[CSV_COL_GRAY]['mean']:.2f}")
+        print(f"  中位数: {stats[CSV_COL_GRAY]['median']:.2f}")
         print(f"  说明: 灰度通道用于单波段可视化和分析")
         
         # 水体掩膜统计
@@ -390,9 +743,10 @@ def compute_indices(input_csv, output_csv, display_stats=None):
         print(f"  非水体像素: {non_water_count} ({non_water_count/len(df)*100:.2f}%)")
         print(f"  说明: 1=水体, 0=非水体")
         
-        # 相关性分析
+        # 相关性分析：直接在融合核输出的float32数组上算，
+        # 避免pandas.corr把两列提升为float64再遍历
         print(f"\n【相关性分析】")
-        correlation = df[CSV_COL_NDWI].corr(df[CSV_COL_NDVI])
+        correlation = float(np.corrcoef(ndwi, ndvi)[0, 1])
         print(f"  NDWI与NDVI相关系数: {correlation:.6f}")
         if correlation < -0.5:
             print(f"  → 强负相关：水体和植被分布明显相反")
@@ -404,19 +758,21 @@ def compute_indices(input_csv, output_csv, display_stats=None):
         # 0-255范围统计
         print(f"\n【0-255范围拉伸值】")
         print(f"  NDWI_255统计:")
-        print(f"    最小值: {df[CSV_COL_NDWI_255].min()}")
-        print(f"    最大值: {df[CSV_COL_NDWI_255].max()}")
-        print(f"    平均值: {df[CSV_COL_NDWI_255].mean():.2f}")
-        print(f"    中位数: {df[CSV_COL_NDWI_255].median():.2f}")
+        print(f"    最小值: {stats[CSV_COL_NDWI_255]['min']:.0f}")
+        print(f"    最大值: {stats[CSV_COL_NDWI_255]['max']:.0f}")
+        print(f"    平均值: {stats[CSV_COL_NDWI_255]['mean']:.2f}")
+        print(f"    中位数: {stats[CSV_COL_NDWI_255]['median']:.2f}")
         print(f"  NDVI_255统计:")
-        print(f"    最小值: {df[CSV_COL_NDVI_255].min()}")
-        print(f"    最大值: {df[CSV_COL_NDVI_255].max()}")
-        print(f"    平均值: {df[CSV_COL_NDVI_255].mean():.2f}")
-        print(f"    中位数: {df[CSV_COL_NDVI_255].median():.2f}")
+        print(f"    最小值: {stats[CSV_COL_NDVI_255]['min']:.0f}")
+        print(f"    最大值: {stats[CSV_COL_NDVI_255]['max']:.0f}")
+        print(f"    平均值: {stats[CSV_COL_NDVI_255]['mean']:.2f}")
+        print(f"    中位数: {stats[CSV_COL_NDVI_255]['median']:.2f}")
         print(f"  说明: 0-255范围适合直接保存为图像或可视化")
-        
+
         print("="*60)
 
+    return df
+
 
 def main():
     """
@@ -19,12 +19,16 @@
 
 import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # 纯文件输出，无需GUI后端（并行子进程中也可安全渲染）
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import argparse
 import os
 from collections import defaultdict
 
+from grid_utils import scatter_to_grid, regular_grid_indices
+
 # ==================== 全局配置参数 ====================
 # CSV列名配置
 CSV_COL_LONGITUDE = 'longitude'        # 经度列名
@@ -58,29 +62,156 @@ TICK_FONTSIZE = 10                     # 刻度字体大小
 DEFAULT_OUTPUT_FORMAT = 'png'          # 输出图像格式
 DEFAULT_OUTPUT_BBOX = 'tight'          # 边界框裁剪
 
+# 快速渲染配置（绕过matplotlib图形合成，用色图LUT+PIL直接写PNG）
+DEFAULT_FAST_RENDER = True             # 默认快速渲染；--fancy恢复matplotlib精绘
+                                       # （坐标轴/色条/标题，慢5-20倍）
+FAST_RENDER_LUT_SIZE = 256             # 色图LUT条目数
+
+# 规则网格索引配置（O(1)算术定位，替代unique排序+searchsorted二分）
+# Parquet伴随文件配置（与step1/step2保持一致）
+PARQUET_SUFFIX = '.parquet'            # Parquet文件后缀
+
+# NumPy伴随文件配置（与step1/step2保持一致）
+NPZ_SUFFIX = '.npz'                    # NumPy存档文件后缀
+
+# CSV读取配置：预声明各列dtype跳过类型推断，配合pyarrow引擎的SIMD解析
+# （字典中多余的列名会被pandas忽略）
+CSV_READ_DTYPES = {
+    'longitude': 'float64', 'latitude': 'float64',
+    'red': 'float32', 'green': 'float32', 'blue': 'float32', 'nir': 'float32',
+    'gray': 'float32', 'ndwi': 'float32', 'ndvi': 'float32',
+    'ndwi_255': 'float32', 'ndvi_255': 'float32',
+    'water_mask': 'uint8',
+}
+
 # 出参说明
 # csv_to_heatmap 返回: 无（直接保存图像文件）
 # ====================================================
 
 
-def csv_to_heatmap(input_csv, output_image, figsize=None, dpi=None, 
-                   cmap_gray=None, cmap_mask=None):
+def load_table(input_csv, columns=None):
     """
-    从CSV文件读取数据并生成热力图
-    
+    读取数据表，优先使用CSV旁的Parquet伴随文件
+
     入参:
     - input_csv (str): 输入CSV文件路径
+    - columns (list): 需要的列名，None时读取全部列（Parquet/npz支持列裁剪）
+
+    方法:
+    ① 优先读取同名.npz伴随文件（无压缩列存档，只取用到的列成员）
+    ② 其次读取同名.parquet文件（跳过文本解析）
+    ③ 否则回退到pd.read_csv（pyarrow引擎+预声明dtype，无pyarrow时用默认引擎；
+       columns非None时经usecols下推列裁剪，解析阶段即跳过无关列）
+    伴随文件比CSV旧时视为过期，不使用
+
+    出参:
+    - pd.DataFrame: 读取的数据表
+    """
+    npz_path = os.path.splitext(input_csv)[0] + NPZ_SUFFIX
+
+    if os.path.exists(npz_path):
+        csv_missing_or_older = (not os.path.exists(input_csv) or
+                                os.path.getmtime(npz_path) >= os.path.getmtime(input_csv))
+        if csv_missing_or_older:
+            print(f"检测到NumPy伴随文件，优先读取: {npz_path}")
+            with np.load(npz_path) as npz:
+                names = columns if columns is not None else list(npz.files)
+                return pd.DataFrame({name: npz[name] for name in names})
+
+    parquet_path = os.path.splitext(input_csv)[0] + PARQUET_SUFFIX
+
+    if os.path.exists(parquet_path):
+        csv_missing_or_older = (not os.path.exists(input_csv) or
+                                os.path.getmtime(parquet_path) >= os.path.getmtime(input_csv))
+        if csv_missing_or_older:
+            print(f"检测到Parquet伴随文件，优先读取: {parquet_path}")
+            try:
+                return pd.read_parquet(parquet_path, columns=columns)
+            except ImportError:
+                print(f"⚠️  未安装pyarrow，回退到CSV读取")
+
+    try:
+        return pd.read_csv(input_csv, engine='pyarrow', dtype=CSV_READ_DTYPES,
+                           usecols=columns)
+    except ImportError:
+        return pd.read_csv(input_csv, dtype=CSV_READ_DTYPES, usecols=columns)
+
+
+def colormap_lut(cmap_name):
+    """
+    将matplotlib色图预计算为256条目的uint8查找表
+
+    入参:
+    - cmap_name (str): matplotlib色图名称
+
+    方法:
+    - 在[0,1]上均匀采样色图，丢弃alpha通道并量化到0-255
+
+    出参:
+    - numpy.ndarray (256, 3) uint8: RGB查找表
+    """
+    cmap = plt.get_cmap(cmap_name)
+    return (cmap(np.linspace(0, 1, FAST_RENDER_LUT_SIZE))[:, :3] * 255).astype(np.uint8)
+
+
+def render_heatmap_fast(gray_matrix, mask_matrix, output_image, cmap_gray, cmap_mask):
+    """
+    快速渲染路径：LUT着色 + PIL直写PNG
+
+    入参:
+    - gray_matrix (numpy.ndarray): 灰度2D矩阵（uint8，缺失像素可为掩膜数组）
+    - mask_matrix (numpy.ndarray): 掩膜2D矩阵（uint8，缺失像素可为掩膜数组）
+    - output_image (str): 输出图像文件路径
+    - cmap_gray (str): 灰度色图名称
+    - cmap_mask (str): 掩膜色图名称
+
+    方法:
+    ① 将两个矩阵按各自值域归一化为0-255的uint8索引（缺失值按最小值处理）
+    ② 用预计算的色图LUT做向量化取色
+    ③ np.hstack并排拼接后用PIL直接写PNG
+       （跳过matplotlib的figure/axes/colorbar合成与Agg栅格化）
+
+    出参:
+    - 无（直接保存图像文件）
+    """
+    from PIL import Image
+
+    lut_max = FAST_RENDER_LUT_SIZE - 1
+    gray_index = np.ma.filled(gray_matrix, GRAY_VMIN)
+    gray_index = ((gray_index - GRAY_VMIN) / (GRAY_VMAX - GRAY_VMIN) * lut_max)
+    gray_index = np.clip(gray_index, 0, lut_max).astype(np.uint8)
+
+    mask_index = np.ma.filled(mask_matrix, MASK_VMIN)
+    mask_index = ((mask_index - MASK_VMIN) / (MASK_VMAX - MASK_VMIN) * lut_max)
+    mask_index = np.clip(mask_index, 0, lut_max).astype(np.uint8)
+
+    rgb = np.hstack([colormap_lut(cmap_gray)[gray_index],
+                     colormap_lut(cmap_mask)[mask_index]])
+    Image.fromarray(rgb).save(output_image)
+
+
+def csv_to_heatmap(input_csv, output_image, figsize=None, dpi=None,
+                   cmap_gray=None, cmap_mask=None, input_df=None,
+                   fast_render=None):
+    """
+    从CSV文件读取数据并生成热力图
+
+    入参:
+    - input_csv (str): 输入CSV文件路径（input_df非None时可为None）
     - output_image (str): 输出图像文件路径
     - figsize (tuple): 图像尺寸，None时使用全局DEFAULT_FIGSIZE
     - dpi (int): 图像分辨率，None时使用全局DEFAULT_DPI
     - cmap_gray (str): 灰度色图，None时使用全局DEFAULT_CMAP_GRAY
     - cmap_mask (str): 掩膜色图，None时使用全局DEFAULT_CMAP_MASK
-    
+    - input_df (pd.DataFrame): 直接传入的step2数据，非None时跳过CSV读取
+    - fast_render (bool): 是否走LUT+PIL快速渲染（无坐标轴/色条），
+      None时使用全局DEFAULT_FAST_RENDER
+
     方法:
-    ① 读取CSV文件并验证必需的列
+    ① 读取CSV文件（或直接使用input_df）并验证必需的列
     ② 提取经纬度和灰度/掩膜数据
     ③ 根据经纬度坐标重建2D矩阵
-    ④ 使用matplotlib绘制并排的两个热力图
+    ④ 使用matplotlib绘制并排的两个热力图（或LUT+PIL快速直写）
     ⑤ 添加色条、标题和标签
     ⑥ 保存为图像文件
     
@@ -96,64 +227,82 @@ def csv_to_heatmap(input_csv, output_image, figsize=None, dpi=None,
         cmap_gray = DEFAULT_CMAP_GRAY
     if cmap_mask is None:
         cmap_mask = DEFAULT_CMAP_MASK
-    
-    print(f"正在读取CSV文件: {input_csv}")
-    
-    # ① 读取CSV文件
-    df = pd.read_csv(input_csv)
-    
+    if fast_render is None:
+        fast_render = DEFAULT_FAST_RENDER
+
+    # ① 读取CSV文件（若上游直接传入DataFrame则跳过磁盘读取）
+    # 只读用到的4列：12列CSV中其余8列在本步骤完全不用，
+    # 列裁剪下推到解析/反序列化阶段，I/O和内存都只按需付费
+    required_cols = [CSV_COL_LONGITUDE, CSV_COL_LATITUDE, CSV_COL_GRAY, CSV_COL_WATER_MASK]
+    if input_df is not None:
+        print(f"使用上游传入的DataFrame（跳过CSV读取）")
+        df = input_df
+    else:
+        print(f"正在读取CSV文件: {input_csv}")
+        df = load_table(input_csv, columns=required_cols)
+
     print(f"CSV数据形状: {df.shape}")
     print(f"列名: {list(df.columns)}")
     
     # ② 验证必需的列
-    required_cols = [CSV_COL_LONGITUDE, CSV_COL_LATITUDE, CSV_COL_GRAY, CSV_COL_WATER_MASK]
     missing_cols = [col for col in required_cols if col not in df.columns]
     if missing_cols:
         raise ValueError(f"CSV文件缺少必需的列: {', '.join(missing_cols)}")
     
-    # ③ 获取唯一的经纬度值并排序
-    unique_lons = sorted(df[CSV_COL_LONGITUDE].unique())
-    unique_lats = sorted(df[CSV_COL_LATITUDE].unique(), reverse=True)  # 纬度从大到小
-    
+    # ③ 计算网格行列索引：坐标来自规则栅格时用O(1)算术直接定位，
+    # 省去unique排序和searchsorted二分；不规则时回退到二分路径
+    lons = df[CSV_COL_LONGITUDE].to_numpy()
+    lats = df[CSV_COL_LATITUDE].to_numpy()
+    lon_grid = regular_grid_indices(lons)
+    lat_grid = regular_grid_indices(lats)
+
+    if lon_grid is not None and lat_grid is not None:
+        cols, width = lon_grid
+        lat_indices, height = lat_grid
+        rows = (height - 1) - lat_indices
+    else:
+        print(f"⚠️  坐标非规则网格，回退到searchsorted二分定位")
+        unique_lons = np.sort(df[CSV_COL_LONGITUDE].unique())
+        unique_lats_asc = np.sort(df[CSV_COL_LATITUDE].unique())
+        width = unique_lons.size
+        height = unique_lats_asc.size
+        cols = np.searchsorted(unique_lons, lons)
+        rows = (height - 1) - np.searchsorted(unique_lats_asc, lats)
+
     print(f"\n空间信息:")
-    print(f"  宽度（列数）: {len(unique_lons)}")
-    print(f"  高度（行数）: {len(unique_lats)}")
-    print(f"  经度范围: {min(unique_lons):.6f} - {max(unique_lons):.6f}")
-    print(f"  纬度范围: {min(unique_lats):.6f} - {max(unique_lats):.6f}")
-    
-    width = len(unique_lons)
-    height = len(unique_lats)
-    
-    # ④ 创建经纬度到像素坐标的映射
-    lon_to_col = {lon: i for i, lon in enumerate(unique_lons)}
-    lat_to_row = {lat: i for i, lat in enumerate(unique_lats)}
-    
-    # ⑤ 初始化2D数组（使用NaN填充，用于标识缺失数据）
-    gray_matrix = np.full((height, width), np.nan, dtype=np.float32)
-    mask_matrix = np.full((height, width), np.nan, dtype=np.float32)
-    
+    print(f"  宽度（列数）: {width}")
+    print(f"  高度（行数）: {height}")
+    print(f"  经度范围: {lons.min():.6f} - {lons.max():.6f}")
+    print(f"  纬度范围: {lats.min():.6f} - {lats.max():.6f}")
+
+    # ④ 初始化2D数组：uint8存储（灰度0-255、掩膜0/1天然是uint8），
+    # 比float32+NaN省4倍内存带宽；缺失像素用单独的布尔有效掩膜标记
+    gray_matrix = np.zeros((height, width), dtype=np.uint8)
+    mask_matrix = np.zeros((height, width), dtype=np.uint8)
+    valid_matrix = np.zeros((height, width), dtype=bool)
+
     print(f"\n正在重建空间结构...")
-    
-    # ⑥ 填充数据到2D矩阵
-    for idx, row in df.iterrows():
-        lon = row[CSV_COL_LONGITUDE]
-        lat = row[CSV_COL_LATITUDE]
-        
-        col = lon_to_col.get(lon)
-        row_idx = lat_to_row.get(lat)
-        
-        if col is not None and row_idx is not None:
-            gray_matrix[row_idx, col] = row[CSV_COL_GRAY]
-            mask_matrix[row_idx, col] = row[CSV_COL_WATER_MASK]
-        
-        if (idx + 1) % 10000 == 0:
-            print(f"  已处理 {idx + 1} / {len(df)} 像素")
-    
+
+    # ⑤⑥ 向量化散射：共享scatter_to_grid核单次写入（行号翻转使纬度从大到小）
+    scatter_to_grid(rows, cols, df[CSV_COL_GRAY].to_numpy(), gray_matrix)
+    scatter_to_grid(rows, cols, df[CSV_COL_WATER_MASK].to_numpy(), mask_matrix)
+    valid_matrix[rows, cols] = True
+
     print(f"✓ 空间结构重建完成")
-    
+
+    # 稀疏栅格时用掩膜数组渲染，缺失像素在imshow中显示为空白；
+    # 全部有效时直接用原数组，省去掩膜数组包装
+    if valid_matrix.all():
+        gray_plot = gray_matrix
+        mask_plot = mask_matrix
+    else:
+        invalid = ~valid_matrix
+        gray_plot = np.ma.masked_array(gray_matrix, mask=invalid)
+        mask_plot = np.ma.masked_array(mask_matrix, mask=invalid)
+
     # ⑦ 统计信息
-    gray_valid = gray_matrix[~np.isnan(gray_matrix)]
-    mask_valid = mask_matrix[~np.isnan(mask_matrix)]
+    gray_valid = gray_matrix[valid_matrix]
+    mask_valid = mask_matrix[valid_matrix]
     
     print(f"\n数据统计:")
     print(f"  灰度通道:")
@@ -166,13 +315,22 @@ def csv_to_heatmap(input_csv, output_image, figsize=None, dpi=None,
     print(f"    水体像素: {(mask_valid == 1).sum()} ({(mask_valid == 1).sum()/len(mask_valid)*100:.2f}%)")
     print(f"    非水体像素: {(mask_valid == 0).sum()} ({(mask_valid == 0).sum()/len(mask_valid)*100:.2f}%)")
     
+    # ⑧ 快速渲染路径：LUT着色后直接写PNG（无figure/axes/colorbar开销）
+    if fast_render:
+        print(f"\n正在快速渲染热力图（LUT+PIL直写）...")
+        render_heatmap_fast(gray_plot, mask_plot, output_image, cmap_gray, cmap_mask)
+        print(f"✅ 热力图生成完成!")
+        print(f"输出文件: {output_image}")
+        print(f"图像尺寸: {width * 2}×{height} 像素（左灰度/右掩膜）")
+        return
+
     # ⑧ 创建图形和子图
     print(f"\n正在生成热力图...")
     
     fig, axes = plt.subplots(1, 2, figsize=figsize, dpi=dpi)
     
     # 子图1：灰度通道热力图
-    im1 = axes[0].imshow(gray_matrix, cmap=cmap_gray, 
+    im1 = axes[0].imshow(gray_plot, cmap=cmap_gray,
                          vmin=GRAY_VMIN, vmax=GRAY_VMAX,
                          interpolation=HEATMAP_INTERPOLATION,
                          aspect='auto')
@@ -187,7 +345,7 @@ def csv_to_heatmap(input_csv, output_image, figsize=None, dpi=None,
     cbar1.ax.tick_params(labelsize=TICK_FONTSIZE)
     
     # 子图2：水体掩膜热力图
-    im2 = axes[1].imshow(mask_matrix, cmap=cmap_mask,
+    im2 = axes[1].imshow(mask_plot, cmap=cmap_mask,
                          vmin=MASK_VMIN, vmax=MASK_VMAX,
                          interpolation=HEATMAP_INTERPOLATION,
                          aspect='auto')
@@ -260,7 +418,10 @@ Output Format:
                        help='Figure size (width height), default: 16 7')
     parser.add_argument('--dpi', type=int, default=150,
                        help='Image resolution (DPI), default: 150')
-    
+    parser.add_argument('--fancy', action='store_true',
+                       help='Render with matplotlib (axes/colorbars/titles); '
+                            'default is the fast LUT+PIL data-only output')
+
     args = parser.parse_args()
     
     # 检查输入文件是否存在
@@ -274,9 +435,10 @@ Output Format:
         os.makedirs(output_dir)
     
     try:
-        csv_to_heatmap(args.input, args.output, 
-                      figsize=tuple(args.figsize), 
-                      dpi=args.dpi)
+        csv_to_heatmap(args.input, args.output,
+                      figsize=tuple(args.figsize),
+                      dpi=args.dpi,
+                      fast_render=not args.fancy)
     except Exception as e:
         print(f"❌ 错误: {str(e)}")
         import traceback
@@ -23,10 +23,16 @@ import numpy as np
 import pandas as pd
 import rasterio
 from rasterio.transform import from_bounds
+from rasterio.enums import Resampling
 from PIL import Image
 import argparse
 import os
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from grid_utils import (scatter_bands_to_grid, scatter_pixels_to_image,
+                        regular_grid_indices)
 
 # ==================== 全局配置参数 ====================
 # 入参配置 - rgb_255_to_reflectance函数
@@ -57,7 +63,15 @@ REFLECTANCE_MAX_VALUE = 10000          # 反射率最大值
 # 输出配置
 OUTPUT_DTYPE_REFLECTANCE = np.uint16   # 反射率模式数据类型
 OUTPUT_DTYPE_RGB = np.uint8            # RGB模式数据类型
-COMPRESSION_TYPE = 'lzw'               # GeoTIFF压缩类型
+COMPRESSION_TYPE = 'deflate'           # GeoTIFF压缩类型（deflate+预测器对平滑影像压缩率优于lzw）
+PREDICTOR_INT = 2                      # 整型数据用水平差分预测器
+TILE_BLOCK_SIZE = 256                  # 内部分块大小：256x256
+NUM_THREADS = 'ALL_CPUS'               # GDAL压缩/解压线程数
+BIGTIFF_MODE = 'IF_SAFER'              # 超过4GB风险时自动切换BigTIFF
+CSV_STREAM_THRESHOLD_MB = 512          # 无伴随文件且CSV超过此大小(MB)时启用分块流式读取
+CSV_CHUNK_ROWS = 1_000_000             # 流式读取时每块的行数
+OVERVIEW_LEVELS = [2, 4, 8, 16]        # 内置金字塔缩放级别
+OVERVIEW_RESAMPLING = Resampling.average  # 金字塔重采样方式
 
 # 默认分辨率
 DEFAULT_RESOLUTION = 0.0001            # 默认像素分辨率（当只有1个像素时）
@@ -76,14 +90,182 @@ BAND_DESC_GREEN = 'Green (B3)'
 BAND_DESC_BLUE = 'Blue (B2)'
 BAND_DESC_NIR = 'NIR (B8)'
 
-# 进度显示配置
-PROGRESS_INTERVAL = 10000              # 每处理多少像素显示一次进度
+# PNG输出配置（可视化文件为临时产物，低压缩级别省CPU，体积代价约10%）
+PNG_OPTIMIZE = False                   # 是否让libpng尝试多种过滤器组合
+PNG_COMPRESS_LEVEL = 1                 # zlib压缩级别（默认6，1约省一半压缩CPU）
+# 可选加速：pip install pillow-simd 可直接替换Pillow，
+# AVX2向量化的PNG过滤器通常能再省约一半编码时间（代码无需改动）
+
+# Parquet伴随文件配置（与step1/step2保持一致）
+PARQUET_SUFFIX = '.parquet'            # Parquet文件后缀
+
+# NumPy伴随文件配置（与step1/step2保持一致）
+NPZ_SUFFIX = '.npz'                    # NumPy存档文件后缀
+
+# CSV读取配置：预声明各列dtype跳过类型推断，配合pyarrow引擎的SIMD解析
+# （字典中多余的列名会被pandas忽略）
+CSV_READ_DTYPES = {
+    'longitude': 'float64', 'latitude': 'float64',
+    'red': 'float32', 'green': 'float32', 'blue': 'float32', 'nir': 'float32',
+    'gray': 'float32', 'ndwi': 'float32', 'ndvi': 'float32',
+    'ndwi_255': 'float32', 'ndvi_255': 'float32',
+    'water_mask': 'uint8',
+}
 
 # 出参说明
 # rgb_255_to_reflectance 返回: numpy.ndarray (uint16) - 反射率值(0-10000)
-# csv_to_geotiff 返回: 无（直接保存GeoTIFF文件）
+# csv_to_geotiff 返回: numpy.ndarray (uint8) - 填充好的像素立方体（同时保存GeoTIFF文件）
 # ====================================================
 
+def load_table(input_csv, columns=None):
+    """
+    读取数据表，优先使用CSV旁的Parquet伴随文件
+
+    入参:
+    - input_csv (str): 输入CSV文件路径
+    - columns (list): 需要的列名，None时读取全部列（Parquet/npz支持列裁剪）
+
+    方法:
+    ① 优先读取同名.npz伴随文件（无压缩列存档，只取用到的列成员）
+    ② 其次读取同名.parquet文件（跳过文本解析）
+    ③ 否则回退到pd.read_csv（pyarrow引擎+预声明dtype，无pyarrow时用默认引擎；
+       columns非None时经usecols下推列裁剪，解析阶段即跳过无关列）
+    伴随文件比CSV旧时视为过期，不使用
+
+    出参:
+    - pd.DataFrame: 读取的数据表
+    """
+    npz_path = os.path.splitext(input_csv)[0] + NPZ_SUFFIX
+
+    if os.path.exists(npz_path):
+        csv_missing_or_older = (not os.path.exists(input_csv) or
+                                os.path.getmtime(npz_path) >= os.path.getmtime(input_csv))
+        if csv_missing_or_older:
+            print(f"检测到NumPy伴随文件，优先读取: {npz_path}")
+            with np.load(npz_path) as npz:
+                names = columns if columns is not None else list(npz.files)
+                return pd.DataFrame({name: npz[name] for name in names})
+
+    parquet_path = os.path.splitext(input_csv)[0] + PARQUET_SUFFIX
+
+    if os.path.exists(parquet_path):
+        csv_missing_or_older = (not os.path.exists(input_csv) or
+                                os.path.getmtime(parquet_path) >= os.path.getmtime(input_csv))
+        if csv_missing_or_older:
+            print(f"检测到Parquet伴随文件，优先读取: {parquet_path}")
+            try:
+                return pd.read_parquet(parquet_path, columns=columns)
+            except ImportError:
+                print(f"⚠️  未安装pyarrow，回退到CSV读取")
+
+    try:
+        return pd.read_csv(input_csv, engine='pyarrow', dtype=CSV_READ_DTYPES,
+                           usecols=columns)
+    except ImportError:
+        return pd.read_csv(input_csv, dtype=CSV_READ_DTYPES, usecols=columns)
+
+
+def should_stream_csv(input_csv):
+    """
+    判断是否对输入CSV启用分块流式读取
+
+    入参:
+    - input_csv (str): 输入CSV文件路径
+
+    方法:
+    - CSV超过CSV_STREAM_THRESHOLD_MB且没有更新的npz/parquet伴随文件时流式读取：
+      有新鲜伴随文件时load_table走列存快路径，内存问题本就不存在
+
+    出参:
+    - bool: True表示应分块流式读取
+    """
+    if input_csv is None or not os.path.exists(input_csv):
+        return False
+    if os.path.getsize(input_csv) < CSV_STREAM_THRESHOLD_MB * 1024 * 1024:
+        return False
+    for suffix in (NPZ_SUFFIX, PARQUET_SUFFIX):
+        sidecar = os.path.splitext(input_csv)[0] + suffix
+        if (os.path.exists(sidecar) and
+                os.path.getmtime(sidecar) >= os.path.getmtime(input_csv)):
+            return False
+    return True
+
+
+def grid_rowcol(lon_values, lat_values, unique_lons, unique_lats_asc):
+    """
+    计算每个数据点的网格行列索引
+
+    入参:
+    - lon_values/lat_values (numpy.ndarray): 数据点的经纬度坐标
+    - unique_lons (numpy.ndarray): 升序的唯一经度数组
+    - unique_lats_asc (numpy.ndarray): 升序的唯一纬度数组
+
+    方法:
+    - 坐标来自规则栅格时用O(1)算术直接定位（round((值-最小值)/步长)），
+      无哈希表、无浮点相等比较，也省去对数级二分
+    - 算术索引的网格规模与unique数组不一致（如分块读取只覆盖部分行）
+      或网格不规则时，回退到searchsorted二分
+    - 行号按纬度从大到小翻转（北在上）
+
+    出参:
+    - tuple (rows, cols): 每个数据点的行、列索引数组
+    """
+    width = unique_lons.size
+    height = unique_lats_asc.size
+    lon_grid = regular_grid_indices(lon_values)
+    lat_grid = regular_grid_indices(lat_values)
+
+    if (lon_grid is not None and lat_grid is not None and
+            lon_grid[1] == width and lat_grid[1] == height):
+        cols = lon_grid[0]
+        rows = (height - 1) - lat_grid[0]
+    else:
+        cols = np.searchsorted(unique_lons, lon_values)
+        rows = (height - 1) - np.searchsorted(unique_lats_asc, lat_values)
+
+    return rows, cols
+
+
+@lru_cache(maxsize=8)
+def build_reflectance_lut(clip_min, clip_max, gamma):
+    """
+    构建256条目的RGB→反射率查找表（按参数组合缓存）
+
+    入参:
+    - clip_min/clip_max (float): 裁剪范围
+    - gamma (float): Gamma校正系数
+
+    方法:
+    - uint8输入只有256个可能取值，对0-255逐级跑一遍完整转换链生成LUT，
+      热路径退化为单次gather（每像素省一次libm pow调用）
+
+    出参:
+    - numpy.ndarray (256,) uint16: RGB级别→反射率查找表
+    """
+    levels = np.arange(256, dtype=np.float32)
+    return rgb_255_to_reflectance(levels, clip_min, clip_max, gamma)
+
+
+@lru_cache(maxsize=8)
+def build_rgb255_lut(clip_min, clip_max, gamma):
+    """
+    构建65536条目的反射率→RGB查找表（按参数组合缓存）
+
+    入参:
+    - clip_min/clip_max (float): 裁剪范围
+    - gamma (float): Gamma校正系数
+
+    方法:
+    - uint16输入至多65536个取值（有效域0-10000，其余经链内clip饱和），
+      预先对全部级别跑一遍转换链，热路径退化为单次gather
+
+    出参:
+    - numpy.ndarray (65536,) uint8: 反射率→RGB级别查找表
+    """
+    levels = np.arange(65536, dtype=np.float32)
+    return reflectance_to_rgb_255(levels, clip_min, clip_max, gamma)
+
+
 def rgb_255_to_reflectance(rgb_array, clip_min=None, clip_max=None, gamma=None):
     """
     将RGB 0-255值反向转换为反射率值（0-10000范围）
@@ -100,7 +282,9 @@ def rgb_255_to_reflectance(rgb_array, clip_min=None, clip_max=None, gamma=None):
     - 逆Min-Max拉伸
     - 恢复到裁剪前的反射率范围
     - 乘以10000转回原始整数值
-    
+    - 全程在单一float32工作缓冲上原地ufunc链执行：
+      消除逐步的中间数组分配（内存带宽受限场景FLOPs不变、字节搬运大减）
+
     出参:
     - np.ndarray: 反射率值（0-10000范围，uint16类型）
     """
@@ -111,23 +295,21 @@ def rgb_255_to_reflectance(rgb_array, clip_min=None, clip_max=None, gamma=None):
         clip_max = DEFAULT_CLIP_MAX
     if gamma is None:
         gamma = DEFAULT_GAMMA
-    
-    # 0-255 → 0-1
-    normalized = rgb_array.astype(np.float32) / RGB_MAX_VALUE
-    
-    # 逆Gamma校正
-    gamma_inverse = np.power(normalized, gamma)
-    
-    # 逆Min-Max拉伸
-    reflectance = gamma_inverse * (clip_max - clip_min) + clip_min
-    
-    # 转换为0-10000范围
-    reflectance_10000 = reflectance * REFLECTANCE_SCALE
-    
-    # 裁剪到合理范围并转为uint16
-    reflectance_10000 = np.clip(reflectance_10000, REFLECTANCE_MIN_VALUE, REFLECTANCE_MAX_VALUE).astype(OUTPUT_DTYPE_REFLECTANCE)
-    
-    return reflectance_10000
+
+    # uint8输入走256条目LUT：单次gather替代全幅pow/乘加链（结果逐位一致）
+    if rgb_array.dtype == np.uint8:
+        lut = build_reflectance_lut(clip_min, clip_max, gamma)
+        return lut[rgb_array]
+
+    # 单一工作缓冲：0-255 → 0-1 → 逆Gamma → 逆拉伸 → 0-10000 → 裁剪
+    buf = rgb_array.astype(np.float32, copy=True)
+    np.divide(buf, RGB_MAX_VALUE, out=buf)
+    np.power(buf, gamma, out=buf)
+    np.multiply(buf, clip_max - clip_min, out=buf)
+    np.add(buf, clip_min, out=buf)
+    np.multiply(buf, REFLECTANCE_SCALE, out=buf)
+    np.clip(buf, REFLECTANCE_MIN_VALUE, REFLECTANCE_MAX_VALUE, out=buf)
+    return buf.astype(OUTPUT_DTYPE_REFLECTANCE)
 
 
 def reflectance_to_rgb_255(reflectance_array, clip_min=None, clip_max=None, gamma=None):
@@ -146,7 +328,8 @@ def reflectance_to_rgb_255(reflectance_array, clip_min=None, clip_max=None, gamm
     - Min-Max拉伸到0-1
     - Gamma校正
     - 缩放到0-255
-    
+    - 全程在单一float32工作缓冲上原地ufunc链执行（同rgb_255_to_reflectance）
+
     出参:
     - np.ndarray: RGB值（0-255范围，uint8类型）
     """
@@ -157,32 +340,31 @@ def reflectance_to_rgb_255(reflectance_array, clip_min=None, clip_max=None, gamm
         clip_max = DEFAULT_CLIP_MAX
     if gamma is None:
         gamma = DEFAULT_GAMMA
-    
-    # 0-10000 → 0-1
-    reflectance = reflectance_array.astype(np.float32) / REFLECTANCE_SCALE
-    
-    # 裁剪到指定范围
-    reflectance = np.clip(reflectance, clip_min, clip_max)
-    
-    # Min-Max拉伸到0-1
-    normalized = (reflectance - clip_min) / (clip_max - clip_min)
-    
-    # Gamma校正
-    gamma_corrected = np.power(normalized, 1.0 / gamma)
-    
-    # 缩放到0-255
-    rgb_255 = (gamma_corrected * RGB_MAX_VALUE).astype(OUTPUT_DTYPE_RGB)
-    
-    return rgb_255
 
+    # uint16输入走65536条目LUT：单次gather替代全幅pow/乘加链（结果逐位一致）
+    if reflectance_array.dtype == np.uint16:
+        lut = build_rgb255_lut(clip_min, clip_max, gamma)
+        return lut[reflectance_array]
+
+    # 单一工作缓冲：0-10000 → 0-1 → 裁剪 → 拉伸 → Gamma → 0-255
+    buf = reflectance_array.astype(np.float32, copy=True)
+    np.divide(buf, REFLECTANCE_SCALE, out=buf)
+    np.clip(buf, clip_min, clip_max, out=buf)
+    np.subtract(buf, clip_min, out=buf)
+    np.divide(buf, clip_max - clip_min, out=buf)
+    np.power(buf, 1.0 / gamma, out=buf)
+    np.multiply(buf, RGB_MAX_VALUE, out=buf)
+    return buf.astype(OUTPUT_DTYPE_RGB)
 
-def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None, 
-                   restore_reflectance=None, clip_min=None, clip_max=None, gamma=None):
+
+def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None,
+                   restore_reflectance=None, clip_min=None, clip_max=None, gamma=None,
+                   input_df=None, rgb_cube=None):
     """
     将CSV文件转换为GeoTIFF影像
-    
+
     入参:
-    - input_csv (str): 输入CSV文件路径
+    - input_csv (str): 输入CSV文件路径（input_df非None时可为None）
     - output_tiff (str): 输出GeoTIFF文件路径
     - bands (str): 输出波段，None时使用全局DEFAULT_BANDS
     - crs (str): 坐标系，None时使用全局DEFAULT_CRS
@@ -190,16 +372,19 @@ def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None,
     - clip_min (float): 原始裁剪下限，None时使用全局DEFAULT_CLIP_MIN
     - clip_max (float): 原始裁剪上限，None时使用全局DEFAULT_CLIP_MAX
     - gamma (float): Gamma校正系数，None时使用全局DEFAULT_GAMMA
-    
+    - input_df (pd.DataFrame): 直接传入的step2数据，非None时跳过CSV读取
+    - rgb_cube (np.ndarray): 上次调用返回的uint8像素立方体（波段,高,宽），
+      非None时跳过逐像素填充（两次调用仅restore_reflectance不同时可复用）
+
     方法:
-    - 读取CSV数据并解析经纬度坐标
+    - 读取CSV数据（或直接使用input_df）并解析经纬度坐标
     - 根据坐标计算影像尺寸和地理变换
+    - 将像素值填充到对应的空间位置（或复用传入的rgb_cube）
     - 将0-255的RGB值反向转换为反射率值
-    - 将像素值填充到对应的空间位置
     - 写入GeoTIFF文件
-    
+
     出参:
-    - 无（直接保存GeoTIFF文件）
+    - np.ndarray: 填充好的uint8像素立方体（可传给下一次调用复用；同时保存GeoTIFF文件）
     """
     # 使用全局默认值
     if bands is None:
@@ -214,52 +399,76 @@ def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None,
         clip_max = DEFAULT_CLIP_MAX
     if gamma is None:
         gamma = DEFAULT_GAMMA
-    
-    print(f"正在读取CSV文件: {input_csv}")
-    df = pd.read_csv(input_csv)
-    
-    # 验证必需的列
+
+    # 只读用到的列：坐标+波段列之外的列在本步骤完全不用，
+    # 列裁剪下推到解析/反序列化阶段，I/O和内存都只按需付费
     required_cols = [CSV_COL_LONGITUDE, CSV_COL_LATITUDE, CSV_COL_RED, CSV_COL_GREEN, CSV_COL_BLUE]
     if bands == DEFAULT_BANDS:
         required_cols.append(CSV_COL_NIR)
-    
-    for col in required_cols:
+
+    # 读取CSV文件（若上游直接传入DataFrame则跳过磁盘读取；
+    # 超大CSV且无伴随文件时只先读坐标两列，波段数据留到填充阶段分块流入）
+    stream_csv = (input_df is None and rgb_cube is None and
+                  should_stream_csv(input_csv))
+    if input_df is not None:
+        print(f"使用上游传入的DataFrame（跳过CSV读取）")
+        df = input_df
+    elif stream_csv:
+        print(f"CSV超过{CSV_STREAM_THRESHOLD_MB}MB且无伴随文件，启用分块流式读取: {input_csv}")
+        print(f"第一遍只读坐标两列确定网格...")
+        try:
+            df = pd.read_csv(input_csv, engine='pyarrow', dtype=CSV_READ_DTYPES,
+                             usecols=required_cols[:2])
+        except ImportError:
+            df = pd.read_csv(input_csv, dtype=CSV_READ_DTYPES,
+                             usecols=required_cols[:2])
+    else:
+        print(f"正在读取CSV文件: {input_csv}")
+        df = load_table(input_csv, columns=required_cols)
+
+    # 验证必需的列（流式读取时df只含坐标两列，波段列由分块阶段的usecols保证）
+    for col in (required_cols[:2] if stream_csv else required_cols):
         if col not in df.columns:
             raise ValueError(f"CSV文件缺少必需的列: {col}")
-    
+
+    # 波段列统一为uint8（0-255整数，转换无损）：
+    # 散射时df[波段].to_numpy()直接得到C序uint8缓冲，热路径免去dtype转换
+    if not stream_csv:
+        for col in required_cols[2:]:
+            if df[col].dtype != OUTPUT_DTYPE_RGB:
+                df[col] = df[col].astype(OUTPUT_DTYPE_RGB, copy=False)
+
     print(f"CSV数据形状: {df.shape}")
     print(f"列名: {list(df.columns)}")
-    
-    # 获取唯一的经纬度值并排序
-    unique_lons = sorted(df[CSV_COL_LONGITUDE].unique())
-    unique_lats = sorted(df[CSV_COL_LATITUDE].unique(), reverse=True)  # 纬度从大到小
-    
+
+    # 获取唯一的经纬度值（np.unique直接返回C层排序的ndarray，
+    # 免去Python级sorted对每个浮点的装箱；降序纬度用[::-1]反向视图）
+    unique_lons = np.unique(df[CSV_COL_LONGITUDE].to_numpy())
+    unique_lats_asc = np.unique(df[CSV_COL_LATITUDE].to_numpy())
+    unique_lats = unique_lats_asc[::-1]  # 纬度从大到小
+
     print(f"\n影像信息:")
-    print(f"  宽度（列数）: {len(unique_lons)}")
-    print(f"  高度（行数）: {len(unique_lats)}")
-    print(f"  经度范围: {min(unique_lons):.6f} - {max(unique_lons):.6f}")
-    print(f"  纬度范围: {min(unique_lats):.6f} - {max(unique_lats):.6f}")
-    
-    width = len(unique_lons)
-    height = len(unique_lats)
-    
+    print(f"  宽度（列数）: {unique_lons.size}")
+    print(f"  高度（行数）: {unique_lats.size}")
+    print(f"  经度范围: {unique_lons[0]:.6f} - {unique_lons[-1]:.6f}")
+    print(f"  纬度范围: {unique_lats_asc[0]:.6f} - {unique_lats_asc[-1]:.6f}")
+
+    width = unique_lons.size
+    height = unique_lats.size
+
     # 计算像素分辨率
     if width > 1:
-        lon_res = (max(unique_lons) - min(unique_lons)) / (width - 1)
+        lon_res = (unique_lons[-1] - unique_lons[0]) / (width - 1)
     else:
         lon_res = DEFAULT_RESOLUTION
-    
+
     if height > 1:
-        lat_res = (max(unique_lats) - min(unique_lats)) / (height - 1)
+        lat_res = (unique_lats_asc[-1] - unique_lats_asc[0]) / (height - 1)
     else:
         lat_res = DEFAULT_RESOLUTION
     
     print(f"  像素分辨率: {lon_res:.6f} (经度) × {lat_res:.6f} (纬度)")
-    
-    # 创建经纬度到像素坐标的映射
-    lon_to_col = {lon: i for i, lon in enumerate(unique_lons)}
-    lat_to_row = {lat: i for i, lat in enumerate(unique_lats)}
-    
+
     # 初始化波段数组
     if bands == DEFAULT_BANDS:
         band_count = BAND_COUNT_RGBN
@@ -280,67 +489,62 @@ def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None,
         print(f"  数据类型: {OUTPUT_DTYPE_RGB.__name__} (RGB值 0-{RGB_MAX_VALUE})")
         print(f"  输出模式: RGB模式（用于可视化）")
     
-    # 创建空数组（初始化为0）
-    image_data = np.zeros((band_count, height, width), dtype=dtype)
-    
-    print(f"\n正在填充像素数据...")
-    
-    # 填充数据
-    filled_pixels = 0
-    
-    # 如果需要恢复反射率，先收集所有RGB数据进行批量转换
+    # 填充uint8像素立方体（两种输出模式共用，可跨调用复用避免重复填充）
+    if rgb_cube is not None:
+        print(f"\n使用上游传入的RGB像素立方体（跳过逐像素填充）")
+        if rgb_cube.shape != (band_count, height, width):
+            raise ValueError(
+                f"rgb_cube形状 {rgb_cube.shape} 与期望 {(band_count, height, width)} 不匹配"
+            )
+    else:
+        rgb_cube = np.zeros((band_count, height, width), dtype=OUTPUT_DTYPE_RGB)
+
+        print(f"\n正在填充像素数据...")
+
+        if stream_csv:
+            # 第二遍按块读入波段数据并散射：峰值内存O(块大小+影像大小)，
+            # 与CSV总行数无关（chunksize迭代不支持pyarrow引擎，用默认C引擎）
+            filled = 0
+            for chunk in pd.read_csv(input_csv, dtype=CSV_READ_DTYPES,
+                                     usecols=required_cols,
+                                     chunksize=CSV_CHUNK_ROWS):
+                rows, cols = grid_rowcol(chunk[CSV_COL_LONGITUDE].to_numpy(),
+                                         chunk[CSV_COL_LATITUDE].to_numpy(),
+                                         unique_lons, unique_lats_asc)
+                scatter_bands_to_grid(rows, cols, chunk[list(band_names)].to_numpy(), rgb_cube)
+                filled += len(chunk)
+            print(f"  成功填充 {filled} 个像素")
+        else:
+            # 向量化填充：行列索引一次算出（规则网格算术定位，回退二分），
+            # 多波段融合散射核每个数据点一遍写完全部波段
+            rows, cols = grid_rowcol(df[CSV_COL_LONGITUDE].to_numpy(),
+                                     df[CSV_COL_LATITUDE].to_numpy(),
+                                     unique_lons, unique_lats_asc)
+            scatter_bands_to_grid(rows, cols, df[list(band_names)].to_numpy(), rgb_cube)
+
+            print(f"  成功填充 {len(df)} 个像素")
+
+    # 根据输出模式决定最终数据（RGB直接使用，反射率需批量反变换）
     if restore_reflectance:
-        # 临时存储RGB值
-        temp_data = np.zeros((band_count, height, width), dtype=OUTPUT_DTYPE_RGB)
-        
-        for idx, row in df.iterrows():
-            lon = row[CSV_COL_LONGITUDE]
-            lat = row[CSV_COL_LATITUDE]
-            
-            col = lon_to_col.get(lon)
-            row_idx = lat_to_row.get(lat)
-            
-            if col is not None and row_idx is not None:
-                for band_idx, band_name in enumerate(band_names):
-                    temp_data[band_idx, row_idx, col] = int(row[band_name])
-                filled_pixels += 1
-            
-            if (idx + 1) % PROGRESS_INTERVAL == 0:
-                print(f"  已处理 {idx + 1} / {len(df)} 像素")
-        
-        print(f"  成功填充 {filled_pixels} 个像素")
         print(f"\n正在将RGB(0-255)转换回反射率值(0-10000)...")
-        
-        # 批量转换所有波段
-        for band_idx in range(band_count):
-            image_data[band_idx] = rgb_255_to_reflectance(temp_data[band_idx], clip_min, clip_max, gamma)
-            print(f"  已转换波段 {band_idx+1}/{band_count}")
-        
+        # LUT gather释放GIL，按波段多线程并行写入同一uint16结果：
+        # 唯一的新分配就是结果本身（np.empty，每个元素都会被gather覆盖）
+        lut = build_reflectance_lut(clip_min, clip_max, gamma)
+        image_data = np.empty(rgb_cube.shape, dtype=OUTPUT_DTYPE_REFLECTANCE)
+        with ThreadPoolExecutor(max_workers=band_count) as executor:
+            list(executor.map(
+                lambda b: np.take(lut, rgb_cube[b], out=image_data[b]),
+                range(band_count)))
+        print(f"  已转换 {band_count} 个波段")
     else:
-        # 直接填充，不转换
-        for idx, row in df.iterrows():
-            lon = row[CSV_COL_LONGITUDE]
-            lat = row[CSV_COL_LATITUDE]
-            
-            col = lon_to_col.get(lon)
-            row_idx = lat_to_row.get(lat)
-            
-            if col is not None and row_idx is not None:
-                for band_idx, band_name in enumerate(band_names):
-                    image_data[band_idx, row_idx, col] = int(row[band_name])
-                filled_pixels += 1
-            
-            if (idx + 1) % PROGRESS_INTERVAL == 0:
-                print(f"  已处理 {idx + 1} / {len(df)} 像素")
-        
-        print(f"  成功填充 {filled_pixels} 个像素")
-    
+        image_data = rgb_cube
+
     # 计算地理变换（Affine变换矩阵）
     # 从边界计算，像素中心对齐
-    left = min(unique_lons) - lon_res / 2
-    top = max(unique_lats) + lat_res / 2
-    right = max(unique_lons) + lon_res / 2
-    bottom = min(unique_lats) - lat_res / 2
+    left = unique_lons[0] - lon_res / 2
+    top = unique_lats_asc[-1] + lat_res / 2
+    right = unique_lons[-1] + lon_res / 2
+    bottom = unique_lats_asc[0] - lat_res / 2
     
     transform = from_bounds(left, bottom, right, top, width, height)
     
@@ -364,12 +568,21 @@ def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None,
         dtype=dtype,
         crs=crs,
         transform=transform,
-        compress=COMPRESSION_TYPE
+        compress=COMPRESSION_TYPE,
+        predictor=PREDICTOR_INT,
+        tiled=True,
+        blockxsize=TILE_BLOCK_SIZE,
+        blockysize=TILE_BLOCK_SIZE,
+        num_threads=NUM_THREADS,
+        BIGTIFF=BIGTIFF_MODE
     ) as dst:
-        # 写入所有波段
-        for band_idx in range(band_count):
-            dst.write(image_data[band_idx], band_idx + 1)
-            
+        # 一次性写入所有波段（单次C层调用，避免逐波段的Python往返）
+        dst.write(image_data)
+
+        # 构建内置金字塔：QGIS/ArcGIS缩小浏览时读金字塔而非全分辨率数据
+        dst.build_overviews(OVERVIEW_LEVELS, OVERVIEW_RESAMPLING)
+        dst.update_tags(ns='rio_overview', resampling='average')
+
         # 设置波段描述
         if bands == DEFAULT_BANDS:
             dst.set_band_description(1, BAND_DESC_RED)
@@ -387,35 +600,47 @@ def csv_to_geotiff(input_csv, output_tiff, bands=None, crs=None,
     print(f"   波段数量: {band_count}")
     print(f"   坐标系: {crs}")
     
-    # 显示数据统计
+    # 显示数据统计（纯归约，不物化非零像素的拷贝：
+    # min用where归约，max对非负数据取全局最大即可，mean用sum/非零计数）
     print(f"\n波段数值统计:")
     for band_idx, band_name in enumerate(band_names):
         band_data = image_data[band_idx]
-        non_zero = band_data[band_data > 0]
-        if len(non_zero) > 0:
-            print(f"  {band_name.upper()}: 最小={non_zero.min()}, 最大={non_zero.max()}, 平均={non_zero.mean():.1f}")
+        nonzero_mask = band_data != 0
+        count = int(np.count_nonzero(nonzero_mask))
+        if count > 0:
+            band_min = int(band_data.min(where=nonzero_mask,
+                                         initial=np.iinfo(band_data.dtype).max))
+            band_max = int(band_data.max())
+            band_mean = float(band_data.sum(dtype=np.float64)) / count
+            print(f"  {band_name.upper()}: 最小={band_min}, 最大={band_max}, 平均={band_mean:.1f}")
         else:
             print(f"  {band_name.upper()}: 无数据")
 
+    return rgb_cube
 
-def csv_to_png(input_csv, output_png, clip_min=None, clip_max=None, gamma=None):
+
+def csv_to_png(input_csv, output_png, clip_min=None, clip_max=None, gamma=None,
+               input_df=None, rgb_cube=None):
     """
     将CSV文件转换为PNG可视化图片
-    
+
     入参:
-    - input_csv (str): 输入CSV文件路径
+    - input_csv (str): 输入CSV文件路径（input_df或rgb_cube非None时可为None）
     - output_png (str): 输出PNG文件路径
     - clip_min (float): 反射率裁剪下限，None时使用全局DEFAULT_CLIP_MIN
     - clip_max (float): 反射率裁剪上限，None时使用全局DEFAULT_CLIP_MAX
     - gamma (float): Gamma校正系数，None时使用全局DEFAULT_GAMMA
-    
+    - input_df (pd.DataFrame): 直接传入的step2数据，非None时跳过CSV读取
+    - rgb_cube (np.ndarray): csv_to_geotiff返回的uint8像素立方体（波段,高,宽），
+      非None时直接取前3波段出图，跳过CSV读取与逐像素填充
+
     方法:
-    - 读取CSV数据并解析经纬度坐标
+    - 读取CSV数据（或直接使用input_df）并解析经纬度坐标
     - 根据坐标计算影像尺寸
     - 将反射率值（0-10000或CSV中的0-255）转换为RGB可视化（0-255）
-    - 将像素值填充到对应的空间位置
+    - 将像素值填充到对应的空间位置（或复用传入的rgb_cube前3波段）
     - 保存为PNG图片
-    
+
     出参:
     - 无（直接保存PNG文件）
     """
@@ -426,90 +651,112 @@ def csv_to_png(input_csv, output_png, clip_min=None, clip_max=None, gamma=None):
         clip_max = DEFAULT_CLIP_MAX
     if gamma is None:
         gamma = DEFAULT_GAMMA
-    
-    print(f"正在读取CSV文件: {input_csv}")
-    df = pd.read_csv(input_csv)
-    
-    # 验证必需的列
-    required_cols = [CSV_COL_LONGITUDE, CSV_COL_LATITUDE, CSV_COL_RED, CSV_COL_GREEN, CSV_COL_BLUE]
-    for col in required_cols:
-        if col not in df.columns:
-            raise ValueError(f"CSV文件缺少必需的列: {col}")
-    
-    print(f"CSV数据形状: {df.shape}")
-    print(f"列名: {list(df.columns)}")
-    
-    # 获取唯一的经纬度值并排序
-    unique_lons = sorted(df[CSV_COL_LONGITUDE].unique())
-    unique_lats = sorted(df[CSV_COL_LATITUDE].unique(), reverse=True)  # 纬度从大到小
-    
-    print(f"\n影像信息:")
-    print(f"  宽度（列数）: {len(unique_lons)}")
-    print(f"  高度（行数）: {len(unique_lats)}")
-    print(f"  经度范围: {min(unique_lons):.6f} - {max(unique_lons):.6f}")
-    print(f"  纬度范围: {min(unique_lats):.6f} - {max(unique_lats):.6f}")
-    
-    width = len(unique_lons)
-    height = len(unique_lats)
-    
-    # 创建经纬度到像素坐标的映射
-    lon_to_col = {lon: i for i, lon in enumerate(unique_lons)}
-    lat_to_row = {lat: i for i, lat in enumerate(unique_lats)}
-    
-    # 初始化RGB数组（只输出RGB 3波段用于PNG）
-    print(f"  输出格式: PNG (RGB 3波段)")
-    print(f"  数据类型: uint8 (RGB值 0-255)")
-    
-    # 创建空数组（初始化为0）
-    image_data = np.zeros((BAND_COUNT_RGB, height, width), dtype=OUTPUT_DTYPE_RGB)
-    
-    print(f"\n正在填充像素数据...")
-    
-    # 填充数据
-    filled_pixels = 0
-    band_names = BAND_NAMES_RGB
-    
-    for idx, row in df.iterrows():
-        lon = row[CSV_COL_LONGITUDE]
-        lat = row[CSV_COL_LATITUDE]
-        
-        col = lon_to_col.get(lon)
-        row_idx = lat_to_row.get(lat)
-        
-        if col is not None and row_idx is not None:
-            for band_idx, band_name in enumerate(band_names):
-                image_data[band_idx, row_idx, col] = int(row[band_name])
-            filled_pixels += 1
-        
-        if (idx + 1) % PROGRESS_INTERVAL == 0:
-            print(f"  已处理 {idx + 1} / {len(df)} 像素")
-    
-    print(f"  成功填充 {filled_pixels} 个像素")
-    
-    # 转换为PIL Image格式（Height, Width, Channels）
-    # numpy数组格式：(Channels, Height, Width) → (Height, Width, Channels)
-    image_array = np.transpose(image_data, (1, 2, 0))
-    
+
+    if rgb_cube is not None:
+        # 复用上游已填充的像素立方体：PNG只需前3个波段，
+        # CSV解析和散射填充都无需重做
+        print(f"使用上游传入的RGB像素立方体（跳过CSV读取与填充）")
+        if rgb_cube.ndim != 3 or rgb_cube.shape[0] < BAND_COUNT_RGB:
+            raise ValueError(
+                f"rgb_cube形状 {rgb_cube.shape} 不含RGB前{BAND_COUNT_RGB}个波段"
+            )
+        # 平面布局(波段,高,宽)→通道在后(高,宽,通道)：转置视图由PIL收尾拷贝，
+        # 这是立方体复用路径上唯一一次全图拷贝
+        image_array = np.transpose(rgb_cube[:BAND_COUNT_RGB], (1, 2, 0))
+        band_names = BAND_NAMES_RGB
+        height, width = image_array.shape[0], image_array.shape[1]
+
+        print(f"\n影像信息:")
+        print(f"  宽度（列数）: {width}")
+        print(f"  高度（行数）: {height}")
+        print(f"  输出格式: PNG (RGB 3波段)")
+        print(f"  数据类型: uint8 (RGB值 0-255)")
+    else:
+        # 只读用到的5列（坐标+RGB），列裁剪下推到解析/反序列化阶段
+        required_cols = [CSV_COL_LONGITUDE, CSV_COL_LATITUDE, CSV_COL_RED, CSV_COL_GREEN, CSV_COL_BLUE]
+
+        # 读取CSV文件（若上游直接传入DataFrame则跳过磁盘读取）
+        if input_df is not None:
+            print(f"使用上游传入的DataFrame（跳过CSV读取）")
+            df = input_df
+        else:
+            print(f"正在读取CSV文件: {input_csv}")
+            df = load_table(input_csv, columns=required_cols)
+
+        # 验证必需的列
+        for col in required_cols:
+            if col not in df.columns:
+                raise ValueError(f"CSV文件缺少必需的列: {col}")
+
+        # 波段列统一为uint8（0-255整数，转换无损）：
+        # 散射时df[波段].to_numpy()直接得到C序uint8缓冲，热路径免去dtype转换
+        for col in required_cols[2:]:
+            if df[col].dtype != OUTPUT_DTYPE_RGB:
+                df[col] = df[col].astype(OUTPUT_DTYPE_RGB, copy=False)
+
+        print(f"CSV数据形状: {df.shape}")
+        print(f"列名: {list(df.columns)}")
+
+        # 获取唯一的经纬度值（np.unique直接返回C层排序的ndarray，
+        # 免去Python级sorted对每个浮点的装箱）
+        unique_lons = np.unique(df[CSV_COL_LONGITUDE].to_numpy())
+        unique_lats_asc = np.unique(df[CSV_COL_LATITUDE].to_numpy())
+
+        print(f"\n影像信息:")
+        print(f"  宽度（列数）: {unique_lons.size}")
+        print(f"  高度（行数）: {unique_lats_asc.size}")
+        print(f"  经度范围: {unique_lons[0]:.6f} - {unique_lons[-1]:.6f}")
+        print(f"  纬度范围: {unique_lats_asc[0]:.6f} - {unique_lats_asc[-1]:.6f}")
+
+        width = unique_lons.size
+        height = unique_lats_asc.size
+
+        # 初始化RGB数组（只输出RGB 3波段用于PNG）
+        print(f"  输出格式: PNG (RGB 3波段)")
+        print(f"  数据类型: uint8 (RGB值 0-255)")
+
+        # 创建空数组（初始化为0）：直接按PIL原生的通道在后(高,宽,通道)布局分配，
+        # 出图时无需转置，也省掉Image.fromarray对非连续视图的隐式拷贝
+        image_array = np.zeros((height, width, BAND_COUNT_RGB), dtype=OUTPUT_DTYPE_RGB)
+
+        print(f"\n正在填充像素数据...")
+
+        # 向量化填充：行列索引一次算出（规则网格算术定位，回退二分），
+        # 通道在后散射核每个数据点一遍写完全部通道
+        band_names = BAND_NAMES_RGB
+        rows, cols = grid_rowcol(df[CSV_COL_LONGITUDE].to_numpy(),
+                                 df[CSV_COL_LATITUDE].to_numpy(),
+                                 unique_lons, unique_lats_asc)
+        scatter_pixels_to_image(rows, cols, df[list(band_names)].to_numpy(), image_array)
+
+        print(f"  成功填充 {len(df)} 个像素")
+
     # 创建PIL图像
     print(f"\n正在创建PNG图像...")
     img = Image.fromarray(image_array, mode='RGB')
     
     # 保存PNG文件
     print(f"正在保存PNG文件: {output_png}")
-    img.save(output_png, 'PNG')
+    img.save(output_png, 'PNG', optimize=PNG_OPTIMIZE, compress_level=PNG_COMPRESS_LEVEL)
     
     print(f"✅ PNG文件创建成功!")
     print(f"   文件路径: {output_png}")
     print(f"   影像尺寸: {width} × {height}")
     print(f"   波段数量: 3 (RGB)")
     
-    # 显示数据统计
+    # 显示数据统计（纯归约，不物化非零像素的拷贝：
+    # min用where归约，max对非负数据取全局最大即可，mean用sum/非零计数）
     print(f"\n波段数值统计:")
     for band_idx, band_name in enumerate(band_names):
-        band_data = image_data[band_idx]
-        non_zero = band_data[band_data > 0]
-        if len(non_zero) > 0:
-            print(f"  {band_name.upper()}: 最小={non_zero.min()}, 最大={non_zero.max()}, 平均={non_zero.mean():.1f}")
+        band_data = image_array[:, :, band_idx]
+        nonzero_mask = band_data != 0
+        count = int(np.count_nonzero(nonzero_mask))
+        if count > 0:
+            band_min = int(band_data.min(where=nonzero_mask,
+                                         initial=np.iinfo(band_data.dtype).max))
+            band_max = int(band_data.max())
+            band_mean = float(band_data.sum(dtype=np.float64)) / count
+            print(f"  {band_name.upper()}: 最小={band_min}, 最大={band_max}, 平均={band_mean:.1f}")
         else:
             print(f"  {band_name.upper()}: 无数据")
 
@@ -19,7 +19,11 @@ CSV转栅格影像启动器（PNG + RGB + BOA三文件输出）
 
 import os
 import sys
-from step4_csv_to_tiff_converter import csv_to_geotiff, csv_to_png
+from step4_csv_to_tiff_converter import (
+    csv_to_geotiff, csv_to_png, load_table,
+    CSV_COL_LONGITUDE, CSV_COL_LATITUDE,
+    CSV_COL_RED, CSV_COL_GREEN, CSV_COL_BLUE, CSV_COL_NIR,
+)
 
 # ==================== 全局配置参数 ====================
 # 路径配置
@@ -105,33 +109,46 @@ def main():
     print()
     
     try:
-        # ========== 第1步：生成PNG可视化图像（RGB 3波段） ==========
+        # ========== 第0步：读取CSV（一次解析，三个输出共用） ==========
+        # 三个输出基于同一份数据：只解析一次CSV，像素立方体也只填充一次，
+        # 后两步通过input_df/rgb_cube复用，省去2/3的IO+解析+填充开销
+        required_cols = [CSV_COL_LONGITUDE, CSV_COL_LATITUDE,
+                         CSV_COL_RED, CSV_COL_GREEN, CSV_COL_BLUE]
+        if BANDS == 'rgbn':
+            required_cols.append(CSV_COL_NIR)
+
+        print(f"正在读取CSV文件: {input_csv}")
+        input_df = load_table(input_csv, columns=required_cols)
+
+        # ========== 第1步：生成RGB栅格影像（RGBN 4波段，uint8） ==========
         print("\n" + "="*60)
-        print("【步骤1/3】生成PNG可视化图像（RGB 3波段，0-255）")
+        print("【步骤1/3】生成RGB栅格影像（RGBN 4波段，0-255，uint8格式）")
         print("="*60)
-        csv_to_png(
+        rgb_cube = csv_to_geotiff(
             input_csv=input_csv,
-            output_png=output_png,
+            output_tiff=output_rgb,
+            bands=BANDS,
+            crs=CRS,
+            restore_reflectance=RESTORE_REFLECTANCE_RGB,
             clip_min=CLIP_MIN,
             clip_max=CLIP_MAX,
-            gamma=GAMMA
+            gamma=GAMMA,
+            input_df=input_df
         )
-        
-        # ========== 第2步：生成RGB栅格影像（RGBN 4波段，uint8） ==========
+
+        # ========== 第2步：生成PNG可视化图像（RGB 3波段） ==========
         print("\n" + "="*60)
-        print("【步骤2/3】生成RGB栅格影像（RGBN 4波段，0-255，uint8格式）")
+        print("【步骤2/3】生成PNG可视化图像（RGB 3波段，0-255）")
         print("="*60)
-        csv_to_geotiff(
+        csv_to_png(
             input_csv=input_csv,
-            output_tiff=output_rgb,
-            bands=BANDS,
-            crs=CRS,
-            restore_reflectance=RESTORE_REFLECTANCE_RGB,
+            output_png=output_png,
             clip_min=CLIP_MIN,
             clip_max=CLIP_MAX,
-            gamma=GAMMA
+            gamma=GAMMA,
+            rgb_cube=rgb_cube
         )
-        
+
         # ========== 第3步：生成BOA反射率影像（RGBN 4波段，uint16） ==========
         print("\n" + "="*60)
         print("【步骤3/3】生成BOA反射率影像（RGBN 4波段，0-10000，uint16格式）")
@@ -144,9 +161,11 @@ def main():
             restore_reflectance=RESTORE_REFLECTANCE_REFLECTANCE,
             clip_min=CLIP_MIN,
             clip_max=CLIP_MAX,
-            gamma=GAMMA
+            gamma=GAMMA,
+            input_df=input_df,
+            rgb_cube=rgb_cube
         )
-        
+
         print("\n" + "="*60)
         print("✅ 所有转换完成！")
         print("="*60)
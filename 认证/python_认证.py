@@ -17,27 +17,28 @@ Google Earth Engine Python API 认证脚本
 import os
 import sys
 
+# ==================== 全局配置参数 ====================
+# GEE 配置文件路径（模块加载时计算一次，反复检查时不再重复展开用户目录）
+GEE_CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "earthengine")
+CREDENTIALS_PATH = os.path.join(GEE_CONFIG_DIR, "credentials")      # 认证凭据文件
+PROJECT_CONFIG_PATH = os.path.join(GEE_CONFIG_DIR, "project_id.txt")  # Project ID 配置文件
+# ====================================================
+
 def check_credentials_exist():
     """
     检查认证凭据文件是否存在
-    
+
     入参:
     - 无
-    
+
     方法:
-    - 检查标准的 GEE 凭据文件路径
+    - 检查模块级缓存的 GEE 凭据文件路径（单次 isfile 系统调用）
     - 支持 Windows、Linux、Mac 三种操作系统
-    
+
     出参:
     - bool: 凭据文件是否存在
     """
-    # 获取用户主目录
-    home = os.path.expanduser("~")
-    
-    # GEE 凭据文件路径
-    credentials_path = os.path.join(home, ".config", "earthengine", "credentials")
-    
-    return os.path.exists(credentials_path)
+    return os.path.isfile(CREDENTIALS_PATH)
 
 
 def authenticate_gee():
@@ -97,14 +98,13 @@ def get_project_id():
     """
     # 默认项目ID（根据您的项目）
     default_project = "applied-pipe-453411-k9"
-    
-    # 配置文件路径
-    home = os.path.expanduser("~")
-    config_dir = os.path.join(home, ".config", "earthengine")
-    config_file = os.path.join(config_dir, "project_id.txt")
-    
+
+    # 配置文件路径（模块级缓存）
+    config_dir = GEE_CONFIG_DIR
+    config_file = PROJECT_CONFIG_PATH
+
     # 尝试从配置文件读取
-    if os.path.exists(config_file):
+    if os.path.isfile(config_file):
         with open(config_file, 'r', encoding='utf-8') as f:
             saved_project = f.read().strip()
             if saved_project:
@@ -129,6 +129,36 @@ def get_project_id():
     return project_id
 
 
+def ping(project_id=None):
+    """
+    轻量连通性检查：用单次最小 RPC 验证认证与网络是否可用
+
+    入参:
+    - project_id (str): Cloud Project ID，如果为None则自动获取
+
+    方法:
+    - 初始化 GEE 后只执行一次 ee.Number(1).getInfo() 往返
+    - 每次 GEE RPC 约 300ms-2s，布尔有效性检查一次往返足够；
+      数据集级的完整验证走 test_connection
+
+    出参:
+    - bool: 连接是否正常
+    """
+    import ee
+
+    # 获取 project_id
+    if project_id is None:
+        project_id = get_project_id()
+
+    # 初始化 GEE（新版API必须指定project）
+    print(f"\n正在初始化 GEE (Project: {project_id})...")
+    ee.Initialize(project=project_id)
+    print("✓ GEE 初始化成功")
+
+    print("正在执行连通性检查（单次最小RPC）...")
+    return ee.Number(1).getInfo() == 1
+
+
 def test_connection(project_id=None):
     """
     测试 GEE 连接是否正常
@@ -138,8 +168,9 @@ def test_connection(project_id=None):
     
     方法:
     - 使用指定的 project_id 初始化 GEE
-    - 执行简单的 API 调用验证连接
-    
+    - 完整验证：项目信息、数据集访问、简单计算各执行一次 RPC
+    - 只需布尔存活检查时用 ping（单次轻量RPC）
+
     出参:
     - bool: 连接是否正常
     """
@@ -223,13 +254,16 @@ def main():
     if check_credentials_exist():
         print("✓ 检测到已存在的认证凭据")
         
-        # 尝试测试连接
+        # 尝试测试连接（有效性检查只需一次轻量RPC，完整数据集验证在认证后执行）
         choice = input("\n是否测试当前认证是否有效？(y/n): ").strip().lower()
         if choice == 'y':
             try:
-                test_connection()
-                print("\n当前认证有效，无需重新认证")
-                return
+                if ping():
+                    print("✓ GEE 连通性检查通过")
+                    print("\n当前认证有效，无需重新认证")
+                    return
+                print("\n❌ 连通性检查未通过")
+                print("可能需要重新认证")
             except Exception as e:
                 print(f"\n❌ 认证测试失败: {str(e)}")
                 print("可能需要重新认证")